@@ -0,0 +1,532 @@
+import heapq
+import math
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+from compatibility import FEATURE_WEIGHTS, MAX_SCORE, pair_scores, score_block
+
+# Seeds scored per block; memory per block is tile_size x partition size bytes
+DEFAULT_TILE_SIZE = 256
+
+# Candidate partners kept per seed before falling back to a full rescoring
+DEFAULT_TOP_K = 16
+
+# Partitions with at most this many distinct feature tuples are allocated by bucket counts
+BUCKET_LIMIT = 2048
+
+# Largest leftover set solved with the exact blossom algorithm in pair_partition
+EXACT_MATCHING_LIMIT = 200
+
+# Largest leftover set pair_partition scores densely (9 bytes per pair); above it the
+# partition keeps its greedy allocation
+MATCHING_LIMIT = 2000
+
+# Local search starts out accepting a one-field (2 point) loss about 1 time in 7
+INITIAL_TEMPERATURE = 1.0
+
+
+def partition_order(order, *keys):
+    """Split sorted row indices into independent partitions.
+
+    `keys` are per-row label arrays (gender codes, building, ...). Rows that
+    differ on any key can never share a room, so each partition can be
+    allocated on its own. Partitions come back in order of first appearance
+    in `order`, each keeping its sorted order.
+    """
+    order = np.asarray(order, dtype=np.intp)
+    if len(order) == 0:
+        return []
+    group = np.zeros(len(order), dtype=np.int64)
+    for key in keys:
+        key_codes, uniques = pd.factorize(np.asarray(key)[order], use_na_sentinel=False)
+        group = group * (len(uniques) + 1) + key_codes
+    group = pd.factorize(group)[0]
+    by_group = np.argsort(group, kind='stable')
+    bounds = np.flatnonzero(np.diff(group[by_group])) + 1
+    return np.split(order[by_group], bounds)
+
+
+def top_candidates(codes, members, start, end, k):
+    """Top-K partner lists for the seeds at positions start..end of a partition.
+
+    Only students later in sorted order are listed, since everyone earlier is
+    placed before a seed is reached. Lists are ordered by score, then by
+    position, and padded with -1. `complete` marks seeds whose list holds
+    every compatible later student.
+    """
+    m = len(members)
+    block = score_block(codes, members[start:end], members[start:])
+    cols = np.arange(start, m)
+    key_type = np.int32 if m * (MAX_SCORE + 1) < 2 ** 31 else np.int64
+    key = block.astype(key_type) * m + (m - 1 - cols).astype(key_type)
+    key[(cols[None, :] <= np.arange(start, end)[:, None]) | (block == 0)] = -1
+
+    if key.shape[1] > k:
+        top = np.argpartition(-key, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(key.shape[1]), key.shape)
+    top_keys = np.take_along_axis(key, top, axis=1)
+    ranked = np.argsort(-top_keys, axis=1, kind='stable')
+    top = np.take_along_axis(top, ranked, axis=1)
+    top_keys = np.take_along_axis(top_keys, ranked, axis=1)
+    positions = np.where(top_keys >= 0, top + start, -1)
+    complete = (key >= 0).sum(axis=1) <= k
+    return positions, complete
+
+
+def greedy_partition(codes, members, id_codes, allocated_ids, max_students_per_room,
+                     room_limit=None, tile_size=DEFAULT_TILE_SIZE, top_k=DEFAULT_TOP_K, next_room=None):
+    """Seed-then-best-match allocation of one partition.
+
+    `members` are row indices in sorted order. For each tile of seeds a
+    bounded top-K candidate list is built once; allocated candidates are
+    skipped lazily and a seed is only rescored against the whole remaining
+    partition when its list runs dry. No full N x N matrix is held.
+    `allocated_ids` is updated in place. Returns rooms as lists of row
+    indices, seed first.
+
+    `next_room`, when given, is called with each seed's row and returns the
+    capacity of the room it gets (at most `max_students_per_room`), or None
+    once no room is left, which ends the partition.
+    """
+    rooms = []
+    n = len(members)
+    need = max_students_per_room - 1
+    for tile_start in range(0, n, tile_size):
+        tile_end = min(tile_start + tile_size, n)
+        if allocated_ids[id_codes[members[tile_start:tile_end]]].all():
+            continue
+        if need > 0:
+            candidates, complete = top_candidates(codes, members, tile_start, tile_end,
+                                                  max(top_k, need))
+
+        for position in range(tile_start, tile_end):
+            seed = members[position]
+            if allocated_ids[id_codes[seed]]:
+                continue
+            seed_need = need
+            if next_room is not None:
+                capacity = next_room(seed)
+                if capacity is None:
+                    return rooms
+                seed_need = capacity - 1
+            room = [seed]
+            allocated_ids[id_codes[seed]] = True
+
+            if seed_need > 0:
+                listed = candidates[position - tile_start]
+                listed = members[listed[listed >= 0]]
+                free = listed[~allocated_ids[id_codes[listed]]]
+                if len(free) < seed_need and not complete[position - tile_start]:
+                    # List exhausted: rescore against every remaining later student
+                    rest = members[position + 1:]
+                    rest = rest[~allocated_ids[id_codes[rest]]]
+                    row = score_block(codes, [seed], rest)[0]
+                    rest, row = rest[row > 0], row[row > 0]
+
+                    # Stable sort keeps sorted-order tie breaking for equal scores
+                    free = rest[np.argsort(-row.astype(np.int16), kind='stable')]
+                for match in free[:seed_need]:
+                    room.append(match)
+                    allocated_ids[id_codes[match]] = True
+
+            rooms.append(room)
+            if room_limit is not None and len(rooms) >= room_limit:
+                return rooms
+    return rooms
+
+
+def feature_buckets(codes, members):
+    """Group a partition's students by identical feature tuple.
+
+    Returns the bucket of each member plus one representative row per bucket.
+    Students in the same bucket score identically against everyone, so they
+    are interchangeable apart from their sorted position.
+    """
+    _, first, bucket = np.unique(codes[members], axis=0, return_index=True, return_inverse=True)
+    return bucket.ravel(), members[first]
+
+
+def bucket_greedy_partition(codes, members, id_codes, allocated_ids, max_students_per_room,
+                            room_limit=None, buckets=None, next_room=None):
+    """Seed-then-best-match allocation of one partition using bucket counts.
+
+    Scores are computed once between bucket representatives instead of
+    between students. Each bucket keeps its unplaced members as a queue in
+    sorted order, and a seed's roommates are drawn from the best-scoring
+    buckets first, earliest position first, so rooms are identical to
+    greedy_partition. `allocated_ids` and `next_room` work as there.
+    """
+    bucket, representatives = buckets if buckets is not None else feature_buckets(codes, members)
+    grouped = np.argsort(bucket, kind='stable')
+    counts = np.bincount(bucket, minlength=len(representatives))
+    queues = np.split(grouped, np.cumsum(counts)[:-1])
+    heads = [0] * len(queues)
+    bucket = bucket.tolist()
+    bucket_scores = score_block(codes, representatives, representatives)
+    partners = {}
+
+    def head(b):
+        # Unplaced members form a suffix of each queue; skip IDs placed as duplicates
+        queue, h = queues[b], heads[b]
+        while h < len(queue) and allocated_ids[id_codes[members[queue[h]]]]:
+            h += 1
+        heads[b] = h
+        return queue[h] if h < len(queue) else None
+
+    def score_groups(b):
+        # Partner buckets grouped by score, best first; built on first use
+        if b not in partners:
+            row = bucket_scores[b]
+            partners[b] = [[score, np.flatnonzero(row == score).tolist()]
+                           for score in np.unique(row[row > 0])[::-1]]
+        return partners[b]
+
+    rooms = []
+    need = max_students_per_room - 1
+    for position in range(len(members)):
+        seed = members[position]
+        if allocated_ids[id_codes[seed]]:
+            continue
+        seed_need = need
+        if next_room is not None:
+            capacity = next_room(seed)
+            if capacity is None:
+                return rooms
+            seed_need = capacity - 1
+        room = [seed]
+        allocated_ids[id_codes[seed]] = True
+
+        if seed_need > 0:
+            for group in score_groups(bucket[position]):
+                heap = []
+                live = []
+                for b in group[1]:
+                    h = head(b)
+                    if h is not None:
+                        live.append(b)
+                        heap.append((h, b))
+                group[1] = live
+                heapq.heapify(heap)
+                while heap and len(room) <= seed_need:
+                    h, b = heapq.heappop(heap)
+                    room.append(members[h])
+                    allocated_ids[id_codes[members[h]]] = True
+                    h = head(b)
+                    if h is not None:
+                        heapq.heappush(heap, (h, b))
+                if len(room) > seed_need:
+                    break
+
+        rooms.append(room)
+        if room_limit is not None and len(rooms) >= room_limit:
+            return rooms
+    return rooms
+
+
+def allocate_partition(codes, members, id_codes, allocated_ids, max_students_per_room,
+                       room_limit=None, tile_size=DEFAULT_TILE_SIZE, next_room=None):
+    """Allocate one partition, by bucket counts when feature tuples repeat often"""
+    buckets = feature_buckets(codes, members)
+    if len(buckets[1]) <= min(BUCKET_LIMIT, len(members) // 2):
+        return bucket_greedy_partition(codes, members, id_codes, allocated_ids,
+                                       max_students_per_room, room_limit, buckets, next_room)
+    return greedy_partition(codes, members, id_codes, allocated_ids, max_students_per_room,
+                            room_limit, tile_size, next_room=next_room)
+
+
+def _allocate_encoded_partition(codes, id_codes, max_students_per_room, room_limit, tile_size):
+    """Process-pool entry point working on one partition's compact encoding.
+
+    Receives only the partition's code matrix and local ID codes, and returns
+    the rooms as a flat array of local row indices plus per-room sizes.
+    """
+    members = np.arange(len(codes), dtype=np.intp)
+    allocated_ids = np.zeros(id_codes.max() + 1 if len(id_codes) else 0, dtype=bool)
+    rooms = allocate_partition(codes, members, id_codes, allocated_ids,
+                               max_students_per_room, room_limit, tile_size)
+    sizes = np.array([len(room) for room in rooms], dtype=np.int32)
+    flat = np.concatenate(rooms).astype(np.int32) if rooms else np.empty(0, dtype=np.int32)
+    return flat, sizes
+
+
+def allocate_partitions(codes, partitions, id_codes, max_students_per_room, total_rooms=None,
+                        tile_size=DEFAULT_TILE_SIZE, workers=None, next_room=None):
+    """Allocate every partition and return rooms as arrays of row indices.
+
+    With `workers` > 1 the partitions are fanned out to a process pool. Each
+    worker gets its partition's int32 code matrix rather than record dicts,
+    and rooms are merged back in partition order so numbering is the same as
+    a sequential run. Duplicate student IDs are only de-duplicated within a
+    partition in that mode. A `next_room` callback (see greedy_partition)
+    shares state across partitions, so it always runs sequentially.
+    """
+    rooms = []
+    if workers and workers > 1 and len(partitions) > 1 and next_room is None:
+        with ProcessPoolExecutor(max_workers=min(workers, len(partitions))) as pool:
+            futures = [
+                pool.submit(_allocate_encoded_partition, codes[members],
+                            pd.factorize(id_codes[members])[0], max_students_per_room,
+                            total_rooms or None, tile_size)
+                for members in partitions
+            ]
+            for members, future in zip(partitions, futures):
+                flat, sizes = future.result()
+                if len(sizes):
+                    rooms.extend(np.split(members[flat], np.cumsum(sizes)[:-1]))
+                # Stop if we've reached room limit
+                if total_rooms and len(rooms) >= total_rooms:
+                    for pending in futures:
+                        pending.cancel()
+                    return rooms[:total_rooms]
+        return rooms
+
+    allocated_ids = np.zeros(id_codes.max() + 1 if len(id_codes) else 0, dtype=bool)
+    for members in partitions:
+        room_limit = total_rooms - len(rooms) if total_rooms else None
+        rooms.extend(allocate_partition(codes, members, id_codes, allocated_ids,
+                                        max_students_per_room, room_limit, tile_size, next_room))
+        # Stop if we've reached room limit
+        if total_rooms and len(rooms) >= total_rooms:
+            break
+    return rooms
+
+
+def total_compatibility(codes, rooms):
+    """Sum of pairwise compatibility scores over all rooms"""
+    total = 0
+    by_size = {}
+    for room in rooms:
+        if len(room) > 1:
+            by_size.setdefault(len(room), []).append(room)
+    for size, group in by_size.items():
+        group = np.asarray(group, dtype=np.intp)
+        for i, j in combinations(range(size), 2):
+            total += int(pair_scores(codes, group[:, i], group[:, j]).sum(dtype=np.int64))
+    return total
+
+
+def _assignment_pairs(scores):
+    """Near-optimal pairing from the assignment relaxation of a score matrix.
+
+    The optimal assignment is a set of cycles; each cycle is cut into the best
+    run of consecutive pairs. Returns (pairs, unpaired) as local indices.
+    """
+    weights = scores.astype(np.int64)
+    np.fill_diagonal(weights, -10 ** 6)
+    _, successor = linear_sum_assignment(weights, maximize=True)
+    pairs, unpaired = [], []
+    seen = np.zeros(len(successor), dtype=bool)
+    for start in range(len(successor)):
+        if seen[start]:
+            continue
+        cycle = [start]
+        seen[start] = True
+        while not seen[successor[cycle[-1]]]:
+            cycle.append(successor[cycle[-1]])
+            seen[cycle[-1]] = True
+        best, best_value = None, -1
+        for shift in range(len(cycle) if len(cycle) % 2 else min(2, len(cycle))):
+            rotated = cycle[shift:] + cycle[:shift]
+            candidate = list(zip(rotated[0::2], rotated[1::2]))
+            value = sum(int(scores[i, j]) for i, j in candidate)
+            if value > best_value:
+                best, best_value = candidate, value
+        pairs.extend(best)
+        if len(cycle) % 2:
+            paired = {i for pair in best for i in pair}
+            unpaired.extend(i for i in cycle if i not in paired)
+    return pairs, unpaired
+
+
+def pair_partition(codes, members, exact_limit=EXACT_MATCHING_LIMIT, matching_limit=MATCHING_LIMIT):
+    """Maximum-weight pairing of one partition into two-person rooms.
+
+    Students with identical feature tuples are paired with each other first:
+    swapping any other pairing into such a pair never lowers the total, so
+    this keeps an optimal solution reachable. That leaves at most one student
+    per distinct tuple, which is solved exactly with blossom matching when
+    there are at most `exact_limit` of them and by the assignment relaxation
+    up to `matching_limit`. Rooms come back ordered by their first member in
+    `members`.
+
+    Returns (rooms, method): method is 'exact' when every leftover was
+    matched by blossom and 'heuristic' when the assignment relaxation was
+    used. With more than `matching_limit` students left over, scoring them
+    would need a dense leftover x leftover block, so (None, 'greedy') comes
+    back instead.
+    """
+    members = np.asarray(members, dtype=np.intp)
+    if len(members) < 2:
+        return [[m] for m in members.tolist()], 'exact'
+    bucket = feature_buckets(codes, members)[0]
+    counts = np.bincount(bucket)
+    grouped = np.argsort(bucket, kind='stable')
+    rank = np.arange(len(grouped)) - (np.cumsum(counts) - counts)[bucket[grouped]]
+    firsts = (rank % 2 == 0) & (rank + 1 < counts[bucket[grouped]])
+    rooms = [[grouped[k], grouped[k + 1]] for k in np.flatnonzero(firsts)]
+    leftover = grouped[(rank % 2 == 0) & ~firsts]
+    if len(leftover) > matching_limit:
+        return None, 'greedy'
+
+    method = 'exact' if len(leftover) <= exact_limit else 'heuristic'
+    while len(leftover) > 1:
+        scores = score_block(codes, members[leftover], members[leftover])
+        if len(leftover) <= exact_limit:
+            graph = nx.Graph()
+            rows, cols = np.nonzero(np.triu(scores, 1))
+            graph.add_weighted_edges_from(zip(rows.tolist(), cols.tolist(), scores[rows, cols].tolist()))
+            pairs = list(nx.max_weight_matching(graph))
+            paired = {i for pair in pairs for i in pair}
+            unpaired = [i for i in range(len(leftover)) if i not in paired]
+        else:
+            pairs, unpaired = _assignment_pairs(scores)
+        rooms.extend([leftover[i], leftover[j]] for i, j in pairs)
+        if not pairs:
+            break
+        leftover = leftover[np.sort(np.asarray(unpaired, dtype=np.intp))]
+    rooms.extend([i] for i in leftover)
+
+    rooms = [sorted(room) for room in rooms]
+    rooms.sort(key=lambda room: room[0])
+    return [members[room].tolist() for room in rooms], method
+
+
+def pair_partitions(codes, partitions, total_rooms=None, exact_limit=EXACT_MATCHING_LIMIT,
+                    matching_limit=MATCHING_LIMIT, greedy_rooms=None):
+    """Maximum-weight pairing of every partition, in partition order.
+
+    Partitions too large to match (see pair_partition) keep their greedy
+    two-person rooms: taken from `greedy_rooms`, an allocate_partitions
+    result, when it covers them, otherwise allocated here. Returns (rooms,
+    methods), with the pairing method of each partition reached.
+    """
+    greedy_by_partition = {}
+    if greedy_rooms is not None:
+        partition_of = np.full(len(codes), -1, dtype=np.intp)
+        for label, members in enumerate(partitions):
+            partition_of[members] = label
+        for room in greedy_rooms:
+            greedy_by_partition.setdefault(partition_of[room[0]], []).append(np.asarray(room).tolist())
+    rooms = []
+    methods = []
+    for label, members in enumerate(partitions):
+        paired, method = pair_partition(codes, members, exact_limit, matching_limit)
+        methods.append(method)
+        if paired is None:
+            paired = greedy_by_partition.get(label, [])
+            # A greedy run cut short by its room limit may not cover the partition
+            if sum(len(room) for room in paired) < len(members):
+                paired = greedy_partition(codes, np.asarray(members, dtype=np.intp), np.arange(len(codes)),
+                                          np.zeros(len(codes), dtype=bool), 2)
+                paired = [np.asarray(room).tolist() for room in paired]
+        rooms.extend(paired)
+        # Stop if we've reached room limit
+        if total_rooms and len(rooms) >= total_rooms:
+            return rooms[:total_rooms], methods
+    return rooms, methods
+
+
+def improve_rooms(codes, rooms, partition_of, capacity, time_limit_s=5, seed=0):
+    """Anytime simulated-annealing improvement of an existing allocation.
+
+    Moves are swaps of two students between rooms and moves of a student into
+    a room with a vacancy, both restricted to one partition. Each move's effect
+    on the total is an O(capacity) delta over the two rooms touched. The search
+    stops at the time budget (or after a long stall) and returns the best
+    allocation seen, plus its total compatibility. Rooms keep their order, and
+    rooms emptied by moves come back empty. `capacity` is one size for every
+    room or a per-room sequence.
+    """
+    rng = random.Random(seed)
+    features = codes.tolist()
+    weights = FEATURE_WEIGHTS.tolist()
+
+    def score(a, b):
+        x, y = features[a], features[b]
+        if x[0] != y[0]:
+            return 0
+        return sum(w for w, p, q in zip(weights, x, y) if p == q)
+
+    def gain(student, room, skip=None):
+        return sum(score(student, other) for other in room if other != student and other != skip)
+
+    rooms = [list(room) for room in rooms]
+    capacities = [capacity] * len(rooms) if np.isscalar(capacity) else list(capacity)
+    room_of = {}
+    rooms_by_partition = {}
+    for r, room in enumerate(rooms):
+        for student in room:
+            room_of[student] = r
+        rooms_by_partition.setdefault(partition_of[room[0]], []).append(r)
+    students = [s for s in room_of if len(rooms_by_partition[partition_of[s]]) > 1]
+    current = best = total_compatibility(codes, rooms)
+    if not students or time_limit_s <= 0:
+        return rooms, best
+
+    journal = []  # moves applied since the best state, for rollback
+    start = time.perf_counter()
+    stall_limit = max(20 * len(students), 10000)
+    since_best = 0
+    temperature = INITIAL_TEMPERATURE
+    iteration = 0
+    while True:
+        iteration += 1
+        if iteration % 256 == 0:
+            elapsed = time.perf_counter() - start
+            if elapsed >= time_limit_s or since_best >= stall_limit:
+                break
+            temperature = INITIAL_TEMPERATURE * (1 - elapsed / time_limit_s)
+
+        a = students[rng.randrange(len(students))]
+        source = room_of[a]
+        candidates = rooms_by_partition[partition_of[a]]
+        target = candidates[rng.randrange(len(candidates))]
+        if target == source:
+            continue
+        source_room, target_room = rooms[source], rooms[target]
+        if len(target_room) < capacities[target] and (not target_room or rng.random() < 0.5):
+            b = None
+            delta = gain(a, target_room) - gain(a, source_room)
+        else:
+            if not target_room:
+                continue
+            b = target_room[rng.randrange(len(target_room))]
+            delta = (gain(b, source_room, a) - gain(a, source_room)
+                     + gain(a, target_room, b) - gain(b, target_room))
+
+        if delta < 0 and (temperature <= 0 or rng.random() >= math.exp(delta / temperature)):
+            since_best += 1
+            continue
+        _apply_move(rooms, room_of, a, b, source, target)
+        journal.append((a, b, source, target))
+        current += delta
+        if current > best:
+            best = current
+            journal.clear()
+            since_best = 0
+        else:
+            since_best += 1
+
+    # Roll back to the best allocation seen
+    for a, b, source, target in reversed(journal):
+        _apply_move(rooms, room_of, a, b, target, source)
+    return rooms, best
+
+
+def _apply_move(rooms, room_of, a, b, source, target):
+    """Move `a` from source to target, swapping with `b` when given"""
+    rooms[source].remove(a)
+    rooms[target].append(a)
+    room_of[a] = target
+    if b is not None:
+        rooms[target].remove(b)
+        rooms[source].append(b)
+        room_of[b] = source
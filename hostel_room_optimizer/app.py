@@ -7,10 +7,22 @@ import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
 import os
-import PyPDF2
 from io import BytesIO
 import openpyxl
 import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+
+from compatibility import StudentEncoder, score_block, score_row
+from rooms import RoomInventory
+from ingest import (COLUMNAR_TYPES, EXPORT_FORMATS, RECORD_TYPES, ParsedFileCache, excel_sheet_names,
+                    export_frame, read_columnar, read_csv_chunked, read_excel_streaming, read_records,
+                    scan_text)
+from documents import PdfDocument
+from schema import resolve_schema
+from allocation import (DEFAULT_TILE_SIZE, allocate_partitions, improve_rooms, pair_partitions,
+                        partition_order, total_compatibility)
 
 # Configure logging
 logging.basicConfig(
@@ -169,6 +181,16 @@ st.markdown("""
         color: #374151;
     }
     
+    .file-type-parquet, .file-type-feather, .file-type-arrow {
+        background: #ede9fe;
+        color: #5b21b6;
+    }
+    
+    .file-type-json, .file-type-xml {
+        background: #e0f2fe;
+        color: #075985;
+    }
+    
     .file-type-other {
         background: #fef3c7;
         color: #92400e;
@@ -551,7 +573,10 @@ class FileProcessor:
             'pdf': '📄',
             'txt': '📝',
             'json': '🔧',
-            'xml': '🔧'
+            'xml': '🔧',
+            'parquet': '🧱',
+            'feather': '🧱',
+            'arrow': '🧱'
         }
         return icons.get(file_type, '📎')
     
@@ -567,6 +592,33 @@ class FileProcessor:
         s = round(size_bytes / p, 2)
         return f"{s} {size_names[i]}"
     
+    @staticmethod
+    def process_file(file, file_type, sheet_name=None):
+        """Process a file with the handler for its type"""
+        if file_type == 'csv':
+            return FileProcessor.process_csv(file)
+        if file_type in ['xlsx', 'xls']:
+            return FileProcessor.process_excel(file, sheet_name)
+        if file_type == 'pdf':
+            return FileProcessor.process_pdf(file)
+        if file_type == 'txt':
+            return FileProcessor.process_text(file)
+        if file_type in COLUMNAR_TYPES:
+            return FileProcessor.process_columnar(file, file_type)
+        if file_type in RECORD_TYPES:
+            return FileProcessor.process_records(file, file_type)
+        return {'info': 'File uploaded successfully but no specific processing available for this type'}
+    
+    @staticmethod
+    def process_file_timed(file, file_type, sheet_name=None):
+        """Process a file, returning (result, seconds taken)"""
+        started = time.perf_counter()
+        try:
+            result = FileProcessor.process_file(file, file_type, sheet_name)
+        except Exception as e:
+            result = {'error': str(e)}
+        return result, time.perf_counter() - started
+    
     @staticmethod
     def process_csv(file):
         """Process CSV file and return basic info"""
@@ -576,31 +628,74 @@ class FileProcessor:
                 file.seek(0)
             except Exception:
                 pass
-            df = pd.read_csv(file)
+            # Stream in chunks, storing text columns as categories
+            df = read_csv_chunked(file)
             return {
                 'rows': len(df),
                 'columns': len(df.columns),
                 'column_names': list(df.columns),
                 'preview': df.head().to_dict('records'),
+                'memory': FileProcessor.format_file_size(int(df.memory_usage(deep=True).sum())),
                 'data': df  # Store actual dataframe
             }
         except Exception as e:
             return {'error': str(e)}
     
     @staticmethod
-    def process_excel(file):
+    def process_excel(file, sheet_name=None):
         """Process Excel file and return basic info"""
         try:
-            try:
-                file.seek(0)
-            except Exception:
-                pass
-            df = pd.read_excel(file)
+            if FileProcessor.get_file_type(getattr(file, 'name', '')) == 'xls':
+                # Legacy .xls workbooks are not readable by openpyxl
+                try:
+                    file.seek(0)
+                except Exception:
+                    pass
+                sheets = list(pd.ExcelFile(file).sheet_names)
+                df = pd.read_excel(file, sheet_name=sheet_name or 0)
+            else:
+                # Stream only the selected sheet in read-only mode
+                sheets = excel_sheet_names(file)
+                df = read_excel_streaming(file, sheet_name)
             return {
                 'rows': len(df),
                 'columns': len(df.columns),
                 'column_names': list(df.columns),
                 'preview': df.head().to_dict('records'),
+                'sheets': sheets,
+                'sheet': sheet_name or sheets[0],
+                'data': df  # Store actual dataframe
+            }
+        except Exception as e:
+            return {'error': str(e)}
+    
+    @staticmethod
+    def process_columnar(file, file_type):
+        """Process Parquet/Feather/Arrow file, reading only the allocator's columns"""
+        try:
+            df, total_columns = read_columnar(file, file_type)
+            return {
+                'rows': len(df),
+                'columns': len(df.columns),
+                'column_names': list(df.columns),
+                'source_columns': total_columns,
+                'preview': df.head().to_dict('records'),
+                'data': df  # Store actual dataframe
+            }
+        except Exception as e:
+            return {'error': str(e)}
+    
+    @staticmethod
+    def process_records(file, file_type):
+        """Process JSON/JSON-lines or XML roster, streaming records in batches"""
+        try:
+            df = read_records(file, file_type)
+            return {
+                'rows': len(df),
+                'columns': len(df.columns),
+                'column_names': [str(col) for col in df.columns],
+                'preview': df.head().to_dict('records'),
+                'memory': FileProcessor.format_file_size(int(df.memory_usage(deep=True).sum())),
                 'data': df  # Store actual dataframe
             }
         except Exception as e:
@@ -614,16 +709,14 @@ class FileProcessor:
                 file.seek(0)
             except Exception:
                 pass
-            pdf_reader = PyPDF2.PdfReader(file)
-            text_preview = ""
-            if len(pdf_reader.pages) > 0:
-                try:
-                    text_preview = pdf_reader.pages[0].extract_text() or ""
-                except Exception:
-                    text_preview = ""
+            data = file.read() if hasattr(file, 'read') else file
+            # Only the page count and metadata are read here; page text is extracted on demand
+            document = PdfDocument(data)
+            document.prefetch([0])
             return {
-                'pages': len(pdf_reader.pages),
-                'text_preview': (text_preview[:200] + "...") if text_preview else ""
+                'pages': document.pages,
+                'metadata': document.metadata,
+                'document': document
             }
         except Exception as e:
             return {'error': str(e)}
@@ -636,14 +729,8 @@ class FileProcessor:
                 file.seek(0)
             except Exception:
                 pass
-            content = file.read()
-            if isinstance(content, bytes):
-                content = content.decode('utf-8', errors='ignore')
-            return {
-                'lines': len(content.split('\n')),
-                'characters': len(content),
-                'preview': content[:200] + "..." if len(content) > 200 else content
-            }
+            # Counted in fixed-size blocks; only the preview window is decoded
+            return scan_text(file)
         except Exception as e:
             return {'error': str(e)}
 
@@ -652,65 +739,33 @@ class RoomAllocator:
     def __init__(self):
         self.students_df = None
         self.allocation_results = None
+        self.allocation_stats = None
+        self.encoder = None
+        self.codes = None
+        self.allocation_params = None
+        self.inventory = None
+        self.schema_report = None
+        self.overflow_students = []
+        self._row_of = {}
+        self._id_text = {}
+        self._room_of = {}
+        self._occupants = None
+        self._vacancies = {}
         
     def load_student_data(self, df):
         """Load and validate student data"""
-        required_columns = ['student_id', 'name', 'gender']
-        
-        # Check for required columns (flexible naming)
-        df_columns_lower = [col.lower() for col in df.columns]
-        
-        # Map common variations
-        column_mapping = {}
-        for req_col in required_columns:
-            found = False
-            for df_col in df.columns:
-                if any(variation in df_col.lower() for variation in [req_col.replace('_', ''), req_col]):
-                    column_mapping[req_col] = df_col
-                    found = True
-                    break
-            if not found and req_col in ['student_id']:
-                # Try alternatives for student_id
-                for df_col in df.columns:
-                    if any(alt in df_col.lower() for alt in ['id', 'student', 'roll']):
-                        column_mapping[req_col] = df_col
-                        found = True
-                        break
-            
-            if not found:
-                raise ValueError(f"Missing required column: {req_col}")
-        
-        # Create normalized dataframe
-        self.students_df = pd.DataFrame()
-        for req_col, actual_col in column_mapping.items():
-            self.students_df[req_col] = df[actual_col]
-        
-        # Add optional columns with defaults
-        optional_columns = ['course', 'year', 'sleep_time', 'study_hours', 'social_level', 'cleanliness']
-        for col in optional_columns:
-            if col in df.columns:
-                self.students_df[col] = df[col]
-            else:
-                # Try to find similar columns
-                found_col = None
-                for df_col in df.columns:
-                    if col.lower() in df_col.lower():
-                        found_col = df_col
-                        break
-                
-                if found_col:
-                    self.students_df[col] = df[found_col]
-                else:
-                    # Set defaults
-                    if col in ['sleep_time', 'study_hours', 'social_level', 'cleanliness']:
-                        self.students_df[col] = 'medium'
-                    elif col == 'course':
-                        self.students_df[col] = 'General'
-                    elif col == 'year':
-                        self.students_df[col] = 1
-        
+        self.students_df = self.normalize_student_data(df)
         return True
     
+    def normalize_student_data(self, df):
+        """Map an uploaded frame onto the allocator's column names"""
+        # Check for required columns (flexible naming); resolved once per header signature
+        schema = resolve_schema(df.columns)
+        self.schema_report = schema.report()
+        
+        # Create normalized dataframe, filling optional columns with defaults
+        return schema.apply(df)
+    
     def calculate_compatibility_score(self, student1, student2):
         """Calculate compatibility between two students"""
         score = 0
@@ -735,59 +790,312 @@ class RoomAllocator:
                 
         return score
     
-    def allocate_rooms(self, max_students_per_room=2, total_rooms=None):
-        """Allocate students to rooms using compatibility scoring"""
+    def allocate_rooms(self, max_students_per_room=2, total_rooms=None, partition_by=None,
+                       tile_size=DEFAULT_TILE_SIZE, workers=None, method='greedy', time_limit_s=None,
+                       inventory=None):
+        """Allocate students to rooms using compatibility scoring
+        
+        Students of different genders never share a room, so the cohort is
+        allocated one gender partition at a time (optionally split further by
+        the `partition_by` column, e.g. 'building' or 'block'). Scores are
+        computed in tiles per partition, so memory scales with the largest
+        partition rather than the whole cohort. With `workers` > 1 the
+        partitions are allocated in parallel in a process pool.
+        
+        method='matching' pairs two-person rooms by maximum-weight matching
+        instead of the greedy seed-then-best-match loop, and records the
+        greedy total alongside for comparison. Pairing is exact only for
+        partitions with few unmatched students; `allocation_stats['pairing']`
+        records per partition whether it was 'exact', 'heuristic', or too
+        large to match and kept its 'greedy' rooms.
+        
+        With `time_limit_s`, a local search then swaps and moves students
+        between rooms until the budget runs out, keeping the best allocation
+        found.
+        
+        With a RoomInventory, students fill the inventory's real rooms (each
+        up to its own capacity, respecting gender designations) instead of
+        synthetic R### rooms; anyone left over is reported as overflow.
+        """
         if self.students_df is None:
             raise ValueError("No student data loaded")
+        if method not in ('greedy', 'matching'):
+            raise ValueError(f"Unknown allocation method: {method}")
+        if method == 'matching' and max_students_per_room != 2:
+            raise ValueError("Optimal pairing requires exactly 2 students per room")
+        if method == 'matching' and inventory is not None:
+            raise ValueError("Optimal pairing does not support a room inventory")
+        if partition_by is not None and partition_by not in self.students_df.columns:
+            raise ValueError(f"Cannot partition by missing column: {partition_by}")
             
         students = self.students_df.to_dict('records')
-        allocated_students = set()
-        room_allocations = []
-        room_number = 1
+        
+        # Encode features once; scores are computed per partition tile
+        self.encoder = StudentEncoder()
+        codes = self.encoder.transform(self.students_df)
+        
+        # Students are tracked by ID, so duplicate IDs are only placed once;
+        # rows with a missing ID cannot be told apart and each get their own code
+        id_codes, id_uniques = pd.factorize(self.students_df['student_id'])
+        missing = id_codes < 0
+        id_codes[missing] = len(id_uniques) + np.arange(missing.sum())
         
         # Sort students by gender for better grouping
-        students_sorted = sorted(students, key=lambda x: (x['gender'], x.get('course', ''), x.get('year', 0)))
+        order = sorted(range(len(students)), key=lambda i: (
+            students[i]['gender'], students[i].get('course', ''), students[i].get('year', 0)))
+        
+        keys = [codes[:, 0]]
+        if partition_by is not None:
+            keys.append(self.students_df[partition_by].to_numpy())
+        partitions = partition_order(order, *keys)
         
-        for student in students_sorted:
-            if student['student_id'] in allocated_students:
+        self.inventory = inventory
+        if inventory is not None:
+            inventory.reset()
+        max_students_per_room, next_room, assigned = self._room_source(
+            max_students_per_room, lambda row: students[row]['gender'])
+        rooms = allocate_partitions(codes, partitions, id_codes, max_students_per_room,
+                                    total_rooms, tile_size, workers, next_room)
+        self.allocation_stats = {
+            'method': method,
+            'total_compatibility': total_compatibility(codes, rooms)
+        }
+        if method == 'matching':
+            self.allocation_stats['greedy_compatibility'] = self.allocation_stats['total_compatibility']
+            rooms, self.allocation_stats['pairing'] = pair_partitions(codes, partitions, total_rooms,
+                                                                      greedy_rooms=rooms)
+            self.allocation_stats['total_compatibility'] = total_compatibility(codes, rooms)
+        if time_limit_s:
+            partition_of = np.empty(len(students), dtype=np.intp)
+            for label, members in enumerate(partitions):
+                partition_of[members] = label
+            self.allocation_stats.setdefault('greedy_compatibility', self.allocation_stats['total_compatibility'])
+            capacities = ([int(inventory.capacity[i]) for i in assigned] if inventory is not None
+                          else max_students_per_room)
+            rooms, self.allocation_stats['total_compatibility'] = improve_rooms(
+                codes, rooms, partition_of, capacities, time_limit_s)
+        
+        room_allocations = []
+        for position, room in enumerate(rooms):
+            if len(room) == 0:
+                # Emptied by the local search
+                if inventory is not None:
+                    inventory.release(assigned[position])
                 continue
-                
-            current_room = {
-                'room_number': f"R{room_number:03d}",
-                'students': [student],
-                'capacity': max_students_per_room,
-                'gender': student['gender']
-            }
-            allocated_students.add(student['student_id'])
-            
-            # Find compatible roommates
-            if max_students_per_room > 1:
-                best_matches = []
-                for other_student in students_sorted:
-                    if (other_student['student_id'] not in allocated_students and 
-                        len(current_room['students']) < max_students_per_room):
-                        
-                        compatibility = self.calculate_compatibility_score(student, other_student)
-                        if compatibility > 0:
-                            best_matches.append((other_student, compatibility))
-                
-                # Sort by compatibility and add best matches
-                best_matches.sort(key=lambda x: x[1], reverse=True)
-                for match_student, score in best_matches:
-                    if len(current_room['students']) < max_students_per_room:
-                        current_room['students'].append(match_student)
-                        allocated_students.add(match_student['student_id'])
-            
-            room_allocations.append(current_room)
-            room_number += 1
-            
-            # Stop if we've reached room limit
-            if total_rooms and len(room_allocations) >= total_rooms:
-                break
+            room_allocations.append(self._make_room(
+                [students[i] for i in room], len(room_allocations),
+                assigned[position] if inventory is not None else None, max_students_per_room))
+        
+        placed = np.zeros(len(students), dtype=bool)
+        for room in rooms:
+            placed[room] = True
+        self.overflow_students = [students[i] for i in np.flatnonzero(~placed)]
         
         self.allocation_results = room_allocations
+        self.allocation_params = {'max_students_per_room': max_students_per_room, 'total_rooms': total_rooms,
+                                  'partition_by': partition_by}
+        self._index_allocation(codes)
         return room_allocations
     
+    def _room_source(self, max_students_per_room, gender_of):
+        """Room sizes for the allocation kernels: uniform, or drawn from the inventory"""
+        if self.inventory is None:
+            return max_students_per_room, None, None
+        assigned = []
+        
+        def next_room(row):
+            index = self.inventory.take(gender_of(row))
+            if index is None:
+                return None
+            assigned.append(index)
+            return int(self.inventory.capacity[index])
+        
+        return int(self.inventory.capacity.max()), next_room, assigned
+    
+    def _make_room(self, members, room_index, inventory_index, capacity):
+        """Build an allocation result entry for one room"""
+        if inventory_index is not None:
+            room = self.inventory.describe(inventory_index)
+        else:
+            room = {'room_number': f"R{room_index + 1:03d}", 'capacity': capacity}
+        room['students'] = members
+        room['gender'] = members[0]['gender']
+        return room
+    
+    def _index_allocation(self, codes):
+        """Cache encodings, room membership and vacancies for incremental updates.
+        
+        `_occupants` holds each room's encoded rows padded with -1, and
+        `_vacancies` a sorted array of the rooms with a free bed per partition.
+        """
+        self.codes = codes
+        self._row_of = dict(zip(self.students_df['student_id'], range(len(codes))))
+        self._id_text = {str(student_id): student_id for student_id in self._row_of}
+        self._room_of = {}
+        self._vacancies = {}
+        width = max([self.allocation_params['max_students_per_room']] +
+                    [room['capacity'] for room in self.allocation_results])
+        self._occupants = np.full((0, width), -1, dtype=np.intp)
+        self._append_rooms(self.allocation_results)
+    
+    def _append_rooms(self, rooms):
+        """Index rooms just added to the end of allocation_results"""
+        first = len(self._occupants)
+        occupants = np.full((len(rooms), self._occupants.shape[1]), -1, dtype=np.intp)
+        for offset, room in enumerate(rooms):
+            for slot, student in enumerate(room['students']):
+                self._room_of[student['student_id']] = first + offset
+                occupants[offset, slot] = self._row_of[student['student_id']]
+        self._occupants = np.concatenate([self._occupants, occupants])
+        for offset, room in enumerate(rooms):
+            if len(room['students']) < room['capacity']:
+                self._mark_vacant(self._vacancy_key(room['students'][0]), first + offset)
+    
+    def _mark_vacant(self, key, room_index):
+        vacant = self._vacancies.get(key, np.empty(0, dtype=np.intp))
+        position = np.searchsorted(vacant, room_index)
+        if position == len(vacant) or vacant[position] != room_index:
+            self._vacancies[key] = np.insert(vacant, position, room_index)
+    
+    def _vacancy_key(self, student):
+        """Students may only fill vacancies in rooms of their own partition"""
+        partition_by = self.allocation_params['partition_by']
+        return (student['gender'], student.get(partition_by) if partition_by else None)
+    
+    def remove_students(self, student_ids):
+        """Withdraw students, leaving their beds vacant without touching other rooms.
+        
+        IDs are matched by value or by their text, so '1001' finds a numeric
+        roster ID. Returns (removed count, IDs not on the roster).
+        """
+        if self.allocation_results is None:
+            raise ValueError("No allocation to update")
+        not_found = []
+        resolved = set()
+        for student_id in student_ids:
+            if student_id in self._row_of:
+                resolved.add(student_id)
+            elif str(student_id) in self._id_text:
+                resolved.add(self._id_text[str(student_id)])
+            else:
+                not_found.append(student_id)
+        student_ids = resolved
+        lost = 0
+        for student_id in student_ids:
+            row = self._row_of.pop(student_id)
+            self._id_text.pop(str(student_id), None)
+            room_index = self._room_of.pop(student_id, None)
+            if room_index is None:
+                # Overflow students hold no bed
+                continue
+            room = self.allocation_results[room_index]
+            leaving = [s for s in room['students'] if s['student_id'] == student_id]
+            room['students'] = [s for s in room['students'] if s['student_id'] != student_id]
+            occupants = self._occupants[room_index]
+            occupants[occupants == row] = -1
+            lost += int(score_row(self.codes, row, occupants[occupants >= 0]).sum(dtype=np.int64))
+            self._mark_vacant(self._vacancy_key(leaving[0]), room_index)
+        self._update_compatibility(-lost)
+        
+        self.students_df = self.students_df[~self.students_df['student_id'].isin(student_ids)]
+        self.overflow_students = [s for s in self.overflow_students if s['student_id'] not in student_ids]
+        return len(student_ids), not_found
+    
+    def add_students(self, df):
+        """Place late arrivals into vacancies, opening new rooms only when needed
+        
+        Newcomers are encoded with the cached encoder and each one joins the
+        vacant room of the same gender whose current occupants it scores best
+        with. Those left over are allocated among themselves into new rooms.
+        Settled rooms are never rearranged.
+        """
+        if self.allocation_results is None:
+            raise ValueError("No allocation to update")
+        new_df = self.normalize_student_data(df)
+        duplicates = set(new_df['student_id']) & set(self._row_of)
+        if duplicates:
+            raise ValueError(f"Students already loaded: {', '.join(map(str, sorted(duplicates, key=str)))}")
+        
+        new_df = new_df.reindex(columns=self.students_df.columns)
+        new_codes = self.encoder.transform(new_df)
+        first_row = len(self.codes)
+        self.codes = np.concatenate([self.codes, new_codes])
+        newcomers = new_df.to_dict('records')
+        for offset, student in enumerate(newcomers):
+            self._row_of[student['student_id']] = first_row + offset
+            self._id_text[str(student['student_id'])] = student['student_id']
+        self.students_df = pd.concat([self.students_df, new_df], ignore_index=True)
+        
+        # Sort newcomers the same way as a full allocation
+        order = sorted(range(len(newcomers)), key=lambda i: (
+            newcomers[i]['gender'], newcomers[i].get('course', ''), newcomers[i].get('year', 0)))
+        
+        placed = 0
+        gained = 0
+        unplaced = []
+        for i in order:
+            student = newcomers[i]
+            row = first_row + i
+            key = self._vacancy_key(student)
+            vacant = self._vacancies.get(key)
+            if vacant is None or len(vacant) == 0 or new_codes[i, 0] < 0:
+                unplaced.append(row)
+                continue
+            # Score against every vacant room's occupants at once; padding slots count 0
+            occupants = self._occupants[vacant]
+            scores = score_block(self.codes, [row], occupants.ravel())[0].reshape(occupants.shape)
+            fits = (scores * (occupants >= 0)).sum(axis=1, dtype=np.int64)
+            best = int(np.argmax(fits))
+            room_index = int(vacant[best])
+            gained += int(fits[best])
+            room = self.allocation_results[room_index]
+            room['students'].append(student)
+            self._room_of[student['student_id']] = room_index
+            slots = self._occupants[room_index]
+            slots[np.argmax(slots < 0)] = row
+            if len(room['students']) >= room['capacity']:
+                self._vacancies[key] = np.delete(vacant, best)
+            placed += 1
+        
+        # Open new rooms for whoever did not fit, within the original room limit
+        total_rooms = self.allocation_params['total_rooms']
+        room_budget = total_rooms - len(self.allocation_results) if total_rooms else None
+        by_row = {first_row + i: student for i, student in enumerate(newcomers)}
+        if unplaced and (room_budget is None or room_budget > 0):
+            unplaced = np.array(unplaced, dtype=np.intp)
+            keys = [self.codes[unplaced, 0]]
+            partition_by = self.allocation_params['partition_by']
+            if partition_by is not None:
+                keys.append(np.array([by_row[r].get(partition_by) for r in unplaced], dtype=object))
+            partitions = [unplaced[p] for p in partition_order(np.arange(len(unplaced)), *keys)]
+            id_codes = np.arange(len(self.codes))
+            max_students_per_room, next_room, assigned = self._room_source(
+                self.allocation_params['max_students_per_room'], lambda row: by_row[row]['gender'])
+            rooms = allocate_partitions(self.codes, partitions, id_codes, max_students_per_room,
+                                        room_budget, next_room=next_room)
+            gained += total_compatibility(self.codes, rooms)
+            new_rooms = []
+            for position, room in enumerate(rooms):
+                members = [by_row[r] for r in room]
+                new_rooms.append(self._make_room(members, len(self.allocation_results) + position,
+                                                 assigned[position] if assigned is not None else None,
+                                                 max_students_per_room))
+                placed += len(members)
+            self.allocation_results.extend(new_rooms)
+            self._append_rooms(new_rooms)
+        self.overflow_students.extend(student for student in newcomers
+                                      if student['student_id'] not in self._room_of)
+        self._update_compatibility(gained)
+        return placed
+    
+    def _update_compatibility(self, delta):
+        """Keep the reported total in step with incremental changes"""
+        if self.allocation_stats:
+            self.allocation_stats['total_compatibility'] += delta
+            # The greedy baseline and pairing methods no longer describe the current cohort
+            self.allocation_stats.pop('greedy_compatibility', None)
+            self.allocation_stats.pop('pairing', None)
+    
     def get_allocation_summary(self):
         """Get summary statistics of allocation"""
         if not self.allocation_results:
@@ -814,7 +1122,12 @@ class RoomAllocator:
             'average_occupancy': round(avg_occupancy, 1),
             'male_rooms': male_rooms,
             'female_rooms': female_rooms,
-            'unallocated_students': len(self.students_df) - total_students if self.students_df is not None else 0
+            'unallocated_students': len(self.students_df) - total_students if self.students_df is not None else 0,
+            'overflow_students': len(self.overflow_students),
+            **({'free_beds': self.inventory.free_beds() + sum(
+                room['capacity'] - len(room['students']) for room in self.allocation_results)}
+               if self.inventory is not None else {}),
+            **(self.allocation_stats or {})
         }
 
 # Logging System Class (Enhanced)
@@ -848,16 +1161,27 @@ class SSHMLoggingSystem:
             
         return log_entry
     
-    def log_file_upload(self, filename, file_type, file_size, processing_result):
-        """Log file upload activity"""
+    @staticmethod
+    def result_summary(processing_result):
+        """A processing result without its parsed data or open document"""
+        return {k: v for k, v in processing_result.items() if k not in ('data', 'document')}
+    
+    def log_file_upload(self, filename, file_type, file_size, processing_result, processing_time=None, result_key=None):
+        """Log file upload activity.
+        
+        Only a summary of the result is kept; parsed data and open documents
+        stay in the parsed-file cache under `result_key`.
+        """
+        timing = {'processing_time_s': round(processing_time, 3)} if processing_time is not None else {}
+        processing_result = self.result_summary(processing_result)
         if 'error' in processing_result:
             self.log_action('ERROR', 'UPLOAD', 'File Upload Failed', 
                           f'Failed to process {filename}: {processing_result["error"]}',
-                          metadata={'filename': filename, 'file_type': file_type, 'size': file_size})
+                          metadata={'filename': filename, 'file_type': file_type, 'size': file_size, **timing})
         else:
             self.log_action('SUCCESS', 'UPLOAD', 'File Uploaded Successfully', 
                           f'{filename} uploaded and processed successfully',
-                          metadata={'filename': filename, 'file_type': file_type, 'size': file_size, **{k:v for k,v in processing_result.items() if k != 'data'}})
+                          metadata={'filename': filename, 'file_type': file_type, 'size': file_size, **timing, **processing_result})
         
         # Store file info
         file_info = {
@@ -865,7 +1189,9 @@ class SSHMLoggingSystem:
             'file_type': file_type,
             'size': file_size,
             'upload_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'processing_result': processing_result
+            'processing_time': processing_time,
+            'processing_result': processing_result,
+            'result_key': result_key
         }
         self.uploaded_files.append(file_info)
         return file_info
@@ -899,6 +1225,13 @@ if 'logging_system' not in st.session_state:
 
 logging_system = st.session_state.logging_system
 
+# Parsed uploads are cached by content hash across reruns
+if 'parsed_file_cache' not in st.session_state:
+    st.session_state.parsed_file_cache = ParsedFileCache()
+    st.session_state.logged_uploads = {}
+
+file_cache = st.session_state.parsed_file_cache
+
 # Initialize room allocator
 if 'room_allocator' not in st.session_state:
     st.session_state.room_allocator = RoomAllocator()
@@ -939,7 +1272,7 @@ st.markdown("""
     <div class="file-upload-icon">📁</div>
     <div class="file-upload-title">Upload Files</div>
     <div class="file-upload-subtitle">
-        Support for CSV, Excel, PDF, Text files and more. Upload student data, documents, or configuration files.
+        Support for CSV, Excel, Parquet, Feather, JSON, XML, PDF, Text files and more. Upload student data, documents, or configuration files.
     </div>
 </div>
 """, unsafe_allow_html=True)
@@ -948,85 +1281,183 @@ st.markdown("""
 uploaded_files = st.file_uploader(
     "Choose files to upload",
     accept_multiple_files=True,
-    type=['csv', 'xlsx', 'xls', 'pdf', 'txt', 'json', 'xml'],
-    help="Upload multiple files at once. Supported formats: CSV, Excel, PDF, Text, JSON, XML"
+    type=['csv', 'xlsx', 'xls', 'parquet', 'feather', 'arrow', 'pdf', 'txt', 'json', 'xml'],
+    help="Upload multiple files at once. Supported formats: CSV, Excel, Parquet, Feather/Arrow, PDF, Text, JSON, XML"
 )
 
-# Process uploaded files
-if uploaded_files:
-    processor = FileProcessor()
-    
-    for uploaded_file in uploaded_files:
-        file_type = processor.get_file_type(uploaded_file.name)
-        file_size = uploaded_file.size
-        file_icon = processor.get_file_icon(file_type)
-        
-        # Create file info display
-        st.markdown(f"""
-        <div class="file-info-card">
-            <div class="file-info-header">
-                <span style="font-size: 1.5rem;">{file_icon}</span>
-                <span class="file-info-name">{uploaded_file.name}</span>
-                <span class="file-type-badge file-type-{file_type}">{file_type.upper()}</span>
-            </div>
-            <div class="file-info-details">
-                Size: {processor.format_file_size(file_size)} • 
-                Type: {uploaded_file.type} • 
-                Uploaded: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        # Process file based on type
+# Uploads parsed concurrently; Streamlit calls stay on the main thread
+UPLOAD_WORKERS = 4
+
+# Results of the files in the uploader on this run, including any too large to cache
+upload_results = {}
+
+
+def uploaded_data(file_info):
+    """Parsed frame of a logged upload, or None once its cache entry is evicted"""
+    result_key = file_info['result_key']
+    result = upload_results.get(result_key) or file_cache.get(result_key)
+    return result.get('data') if result else None
+
+
+def render_upload(upload, result, elapsed):
+    """Show one processed upload in its slot and record it in the upload log"""
+    uploaded_file = upload['file']
+    file_type = upload['file_type']
+    file_size = uploaded_file.size
+    cache_key = upload['cache_key']
+    sheet_key = f"sheet_{cache_key}"
+    if upload['duplicate_of'] is not None:
+        # Widgets are keyed by content, so an identical upload is only shown once
+        with upload['slot']:
+            st.info(f"ℹ️ Same content as {upload['duplicate_of']}, shown above")
+        return
+    with upload['slot']:
         try:
+            st.caption(f"⏱️ Processed in {elapsed:.2f}s" if elapsed is not None else "⚡ Loaded from cache")
             if file_type == 'csv':
-                result = processor.process_csv(uploaded_file)
                 if 'error' not in result:
                     st.success(f"✅ CSV processed: {result['rows']} rows, {result['columns']} columns")
                     with st.expander("View CSV Preview"):
                         st.write("**Columns:**", ", ".join(result['column_names']))
+                        st.write("**Memory:**", result['memory'])
                         st.dataframe(pd.DataFrame(result['preview']))
                 else:
                     st.error(f"❌ Error processing CSV: {result['error']}")
                     
             elif file_type in ['xlsx', 'xls']:
-                result = processor.process_excel(uploaded_file)
                 if 'error' not in result:
-                    st.success(f"✅ Excel processed: {result['rows']} rows, {result['columns']} columns")
+                    st.success(f"✅ Excel processed: {result['rows']} rows, {result['columns']} columns "
+                               f"(sheet: {result['sheet']})")
+                    if len(result['sheets']) > 1:
+                        st.selectbox("Worksheet", options=result['sheets'],
+                                     index=result['sheets'].index(result['sheet']), key=sheet_key,
+                                     help="Only the selected sheet is parsed")
                     with st.expander("View Excel Preview"):
                         st.write("**Columns:**", ", ".join(result['column_names']))
                         st.dataframe(pd.DataFrame(result['preview']))
                 else:
                     st.error(f"❌ Error processing Excel: {result['error']}")
                     
+            elif file_type in COLUMNAR_TYPES:
+                if 'error' not in result:
+                    st.success(f"✅ {file_type.capitalize()} processed: {result['rows']} rows, "
+                               f"{result['columns']} of {result['source_columns']} columns loaded")
+                    with st.expander(f"View {file_type.capitalize()} Preview"):
+                        st.write("**Columns:**", ", ".join(result['column_names']))
+                        st.dataframe(pd.DataFrame(result['preview']))
+                else:
+                    st.error(f"❌ Error processing {file_type.capitalize()}: {result['error']}")
+                    
+            elif file_type in RECORD_TYPES:
+                if 'error' not in result:
+                    st.success(f"✅ {file_type.upper()} processed: {result['rows']} records, {result['columns']} fields")
+                    with st.expander(f"View {file_type.upper()} Preview"):
+                        st.write("**Fields:**", ", ".join(result['column_names']))
+                        st.write("**Memory:**", result['memory'])
+                        st.dataframe(pd.DataFrame(result['preview']))
+                else:
+                    st.error(f"❌ Error processing {file_type.upper()}: {result['error']}")
+                    
             elif file_type == 'pdf':
-                result = processor.process_pdf(uploaded_file)
                 if 'error' not in result:
                     st.success(f"✅ PDF processed: {result['pages']} pages")
                     with st.expander("View PDF Preview"):
-                        st.text_area("First Page Preview", result['text_preview'], height=150)
+                        if result['metadata']:
+                            st.write("**Metadata:**", ", ".join(f"{k}: {v}" for k, v in result['metadata'].items()))
+                        if result['pages'] > 0:
+                            page = st.number_input("Page", min_value=1, max_value=result['pages'], value=1,
+                                                   key=f"pdf_page_{cache_key}")
+                            st.text_area(f"Page {page} Preview", result['document'].page_text(page - 1),
+                                         height=150)
                 else:
                     st.error(f"❌ Error processing PDF: {result['error']}")
                     
             elif file_type == 'txt':
-                result = processor.process_text(uploaded_file)
                 if 'error' not in result:
-                    st.success(f"✅ Text file processed: {result['lines']} lines, {result['characters']} characters")
+                    st.success(f"✅ Text file processed: {result['lines']} lines, {result['characters']} characters "
+                               f"({result['encoding']})")
                     with st.expander("View Text Preview"):
                         st.text_area("Content Preview", result['preview'], height=150)
                 else:
                     st.error(f"❌ Error processing text file: {result['error']}")
                     
             else:
-                result = {'info': 'File uploaded successfully but no specific processing available for this type'}
                 st.info(f"ℹ️ {uploaded_file.name} uploaded successfully")
             
-            # Log the file upload
-            logging_system.log_file_upload(uploaded_file.name, file_type, file_size, result)
+            # Log the file upload once, not on every rerun
+            upload_results[upload['result_key']] = result
+            if cache_key not in st.session_state.logged_uploads:
+                st.session_state.logged_uploads[cache_key] = logging_system.log_file_upload(
+                    uploaded_file.name, file_type, file_size, result, elapsed, upload['result_key'])
+            else:
+                # Keep the registered result in step with the selected worksheet
+                st.session_state.logged_uploads[cache_key].update(
+                    processing_result=logging_system.result_summary(result),
+                    result_key=upload['result_key'])
             
         except Exception as e:
             st.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
-            logging_system.log_file_upload(uploaded_file.name, file_type, file_size, {'error': str(e)})
+            if cache_key not in st.session_state.logged_uploads:
+                st.session_state.logged_uploads[cache_key] = logging_system.log_file_upload(
+                    uploaded_file.name, file_type, file_size, {'error': str(e)}, elapsed, upload['result_key'])
+
+
+# Process uploaded files
+if uploaded_files:
+    processor = FileProcessor()
+    uploads = []
+    futures = {}
+    first_upload = {}
+    
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        for uploaded_file in uploaded_files:
+            file_type = processor.get_file_type(uploaded_file.name)
+            file_size = uploaded_file.size
+            file_icon = processor.get_file_icon(file_type)
+            cache_key = file_cache.key_for(uploaded_file.getvalue(), file_type)
+            sheet_name = st.session_state.get(f"sheet_{cache_key}")
+            result_key = f"{cache_key}:{sheet_name}" if sheet_name else cache_key
+            
+            # One slot per file keeps the upload order on screen while results arrive out of order
+            slot = st.container()
+            with slot:
+                # Create file info display
+                st.markdown(f"""
+                <div class="file-info-card">
+                    <div class="file-info-header">
+                        <span style="font-size: 1.5rem;">{file_icon}</span>
+                        <span class="file-info-name">{uploaded_file.name}</span>
+                        <span class="file-type-badge file-type-{file_type}">{file_type.upper()}</span>
+                    </div>
+                    <div class="file-info-details">
+                        Size: {processor.format_file_size(file_size)} • 
+                        Type: {uploaded_file.type} • 
+                        Uploaded: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+            first = first_upload.setdefault(cache_key, len(uploads))
+            upload = {'file': uploaded_file, 'file_type': file_type, 'cache_key': cache_key,
+                      'result_key': result_key, 'slot': slot,
+                      'duplicate_of': uploads[first]['file'].name if first < len(uploads) else None}
+            uploads.append(upload)
+            
+            # Parse each distinct file once per session; identical uploads share one job
+            if result_key not in file_cache and result_key not in futures:
+                futures[result_key] = executor.submit(
+                    processor.process_file_timed, uploaded_file, file_type, sheet_name)
+        
+        for upload in uploads:
+            if upload['result_key'] not in futures:
+                render_upload(upload, file_cache.get(upload['result_key']), None)
+        
+        keys = {future: result_key for result_key, future in futures.items()}
+        for future in as_completed(futures.values()):
+            result, elapsed = future.result()
+            result = file_cache.put(keys[future], result)
+            for upload in uploads:
+                if upload['result_key'] == keys[future]:
+                    render_upload(upload, result, elapsed)
 
 # Room Allocation Section
 st.markdown('<div class="section-card">', unsafe_allow_html=True)
@@ -1039,9 +1470,9 @@ student_data_available = False
 suitable_files = []
 
 for file_info in logging_system.uploaded_files:
-    if (file_info['file_type'] in ['csv', 'xlsx', 'xls'] and 
+    if (file_info['file_type'] in ['csv', 'xlsx', 'xls'] + COLUMNAR_TYPES + RECORD_TYPES and 
         'error' not in file_info['processing_result'] and
-        'data' in file_info['processing_result']):
+        (file_info['result_key'] in upload_results or file_info['result_key'] in file_cache)):
         suitable_files.append(file_info)
 
 if suitable_files:
@@ -1063,7 +1494,7 @@ if suitable_files:
     selected_file = suitable_files[selected_file_index]
     
     # Allocation parameters
-    col_param1, col_param2, col_param3 = st.columns(3)
+    col_param1, col_param2, col_param3, col_param4 = st.columns(4)
     
     with col_param1:
         max_per_room = st.number_input(
@@ -1086,24 +1517,43 @@ if suitable_files:
     with col_param3:
         allocation_method = st.selectbox(
             "Allocation Method",
-            options=["Compatibility-based", "Random", "Course-based"],
+            options=["Compatibility-based", "Optimal Pairing", "Random", "Course-based"],
             help="Method for allocating students to rooms"
         )
     
+    with col_param4:
+        time_budget = st.number_input(
+            "Optimization Budget (s)",
+            min_value=0,
+            max_value=60,
+            value=5,
+            help="Time spent improving rooms of 3-4 students after the initial allocation"
+        )
+    
+    inventory_file = st.file_uploader(
+        "Room inventory (optional)",
+        type=['csv'],
+        help="CSV with room_id, building, floor, capacity and gender columns. When given, students fill these rooms instead of generated ones."
+    )
+    
     # Allocation button
     if st.button("🚀 Start Room Allocation", type="primary"):
         try:
             # Load the selected file data
-            student_df = selected_file['processing_result']['data']
+            student_df = uploaded_data(selected_file)
             
             # Load data into allocator
             allocator.load_student_data(student_df)
+            inventory = RoomInventory.from_csv(inventory_file) if inventory_file else None
             
             # Perform allocation
             with st.spinner("Allocating rooms... This may take a moment."):
                 results = allocator.allocate_rooms(
                     max_students_per_room=max_per_room,
-                    total_rooms=total_rooms
+                    total_rooms=None if inventory else total_rooms,
+                    method='matching' if allocation_method == "Optimal Pairing" else 'greedy',
+                    time_limit_s=time_budget if max_per_room > 2 else None,
+                    inventory=inventory
                 )
             
             # Log the allocation
@@ -1115,6 +1565,13 @@ if suitable_files:
             )
             
             st.success(f"✅ Allocation completed! {summary['total_students']} students allocated to {summary['total_rooms']} rooms.")
+            report = allocator.schema_report
+            if report['ambiguous_columns']:
+                st.info("ℹ️ Several columns matched: " + "; ".join(
+                    f"{col} ← {found[0]} (also {', '.join(map(str, found[1:]))})"
+                    for col, found in report['ambiguous_columns'].items()))
+            if report['unmapped_columns']:
+                st.caption("Columns not used for allocation: " + ", ".join(map(str, report['unmapped_columns'])))
             
         except Exception as e:
             logging_system.log_action('ERROR', 'ALLOCATION', 'Allocation Failed', str(e))
@@ -1123,7 +1580,7 @@ if suitable_files:
 else:
     st.markdown("""
     <div class="warning-alert">
-        ⚠️ No suitable student data files found. Please upload a CSV or Excel file with student information including columns like: student_id, name, gender, course, year.
+        ⚠️ No suitable student data files found. Please upload a CSV, Excel, Parquet or Feather file with student information including columns like: student_id, name, gender, course, year.
     </div>
     """, unsafe_allow_html=True)
     
@@ -1150,7 +1607,8 @@ else:
             'data': sample_students
         }
         
-        logging_system.log_file_upload('sample_students.csv', 'csv', 1024, result)
+        file_cache.put('csv:sample_students', result)
+        logging_system.log_file_upload('sample_students.csv', 'csv', 1024, result, result_key='csv:sample_students')
         st.success("✅ Sample data generated! You can now run room allocation.")
         st.rerun()
 
@@ -1172,6 +1630,23 @@ if allocator.allocation_results:
     with col_sum4:
         st.metric("Unallocated", summary['unallocated_students'])
     
+    if summary['overflow_students']:
+        st.warning(f"⚠️ {summary['overflow_students']} students could not be placed: no suitable room was left.")
+        with st.expander("View Overflow Students"):
+            st.dataframe(pd.DataFrame(allocator.overflow_students), use_container_width=True)
+    
+    if 'greedy_compatibility' in summary:
+        st.caption(f"Total compatibility: {summary['total_compatibility']} "
+                   f"(greedy allocation: {summary['greedy_compatibility']})")
+    elif 'total_compatibility' in summary:
+        st.caption(f"Total compatibility: {summary['total_compatibility']}")
+    if 'pairing' in summary:
+        pairing_labels = {'exact': 'optimal', 'heuristic': 'near-optimal (assignment heuristic)',
+                          'greedy': 'too large to match, greedy rooms kept'}
+        st.caption("Pairing by partition: " + ", ".join(
+            f"{summary['pairing'].count(method)} {label}" for method, label in pairing_labels.items()
+            if method in summary['pairing']))
+    
     # Room details in expandable cards
     st.markdown("### 🏠 Room Details")
     
@@ -1204,22 +1679,59 @@ if allocator.allocation_results:
     col_export1, col_export2 = st.columns(2)
     
     with col_export1:
+        export_format = st.selectbox("Export Format", options=list(EXPORT_FORMATS))
         if st.button("💾 Export Allocation Results"):
-            csv = results_df.to_csv(index=False)
+            extension, mime = EXPORT_FORMATS[export_format]
             st.download_button(
-                label="Download Results CSV",
-                data=csv,
-                file_name=f"sshm_room_allocation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
+                label=f"Download Results {export_format}",
+                data=export_frame(results_df, export_format),
+                file_name=f"sshm_room_allocation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}",
+                mime=mime
             )
             logging_system.log_action('SUCCESS', 'EXPORT', 'Results Exported', 
-                                    'Room allocation results exported successfully')
+                                    'Room allocation results exported successfully',
+                                    metadata={'format': extension, 'rooms': len(allocator.allocation_results)})
     
     with col_export2:
         if st.button("🔄 Clear Allocation"):
             st.session_state.room_allocator = RoomAllocator()
             st.success("Allocation cleared!")
             st.rerun()
+    
+    # Incremental updates keep settled rooms as they are
+    with st.expander("🔁 Late Arrivals & Withdrawals"):
+        withdraw_ids = st.text_input("Withdrawn student IDs (comma separated)")
+        # Shown after the rerun that follows a withdrawal
+        if 'withdrawal_not_found' in st.session_state:
+            st.warning(f"⚠️ Not on the roster: {', '.join(st.session_state.pop('withdrawal_not_found'))}")
+        if st.button("➖ Remove Students") and withdraw_ids.strip():
+            ids = [sid.strip() for sid in withdraw_ids.split(',') if sid.strip()]
+            removed, not_found = allocator.remove_students(ids)
+            logging_system.log_action('INFO', 'ALLOCATION', 'Students Withdrawn',
+                                    f'{removed} students removed from their rooms',
+                                    metadata={'requested': len(ids), 'removed': removed, 'not_found': not_found})
+            if not_found:
+                st.session_state.withdrawal_not_found = not_found
+            st.success(f"✅ {removed} students removed.")
+            st.rerun()
+        
+        if suitable_files:
+            arrival_index = st.selectbox(
+                "Late arrivals file:",
+                options=range(len(suitable_files)),
+                format_func=lambda x: suitable_files[x]['filename']
+            )
+            if st.button("➕ Add Late Arrivals"):
+                try:
+                    placed = allocator.add_students(uploaded_data(suitable_files[arrival_index]))
+                    logging_system.log_action('SUCCESS', 'ALLOCATION', 'Late Arrivals Placed',
+                                            f'{placed} late arrivals placed into rooms',
+                                            metadata={'placed': placed})
+                    st.success(f"✅ {placed} late arrivals placed.")
+                    st.rerun()
+                except Exception as e:
+                    logging_system.log_action('ERROR', 'ALLOCATION', 'Late Arrivals Failed', str(e))
+                    st.error(f"❌ Could not add students: {str(e)}")
 
 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -0,0 +1,53 @@
+import argparse
+import math
+import time
+
+import numpy as np
+import pandas as pd
+
+from generate_data import generate_student
+from model import KMEANS_BACKENDS, fit_kmeans
+
+
+def inertia(X, labels):
+    """Sum of squared distances to cluster means, computed the same way for every backend"""
+    X = X.toarray() if hasattr(X, 'toarray') else np.asarray(X)
+    counts = np.bincount(labels)
+    sums = np.zeros((len(counts), X.shape[1]))
+    np.add.at(sums, labels, X)
+    centers = sums / np.maximum(counts, 1)[:, None]
+    return float(((X - centers[labels]) ** 2).sum())
+
+
+def run(sizes, room_capacity=2, backends=KMEANS_BACKENDS, kmeans_limit=5000, seed=42):
+    """Time each backend on cohorts of the given sizes; full KMeans only up to kmeans_limit students"""
+    rows = []
+    for n in sizes:
+        df = generate_student(n, seed)
+        n_clusters = math.ceil(n / room_capacity)
+        for backend in backends:
+            if backend == 'kmeans' and n > kmeans_limit:
+                continue
+            started = time.perf_counter()
+            clustered, km, pre = fit_kmeans(df, n_clusters, backend=backend)
+            elapsed = time.perf_counter() - started
+            X = pre.transform(df)
+            rows.append({
+                'students': n,
+                'clusters': n_clusters,
+                'backend': backend,
+                'inertia': round(inertia(X, clustered['cluster'].to_numpy()), 2),
+                'seconds': round(elapsed, 2),
+            })
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare fit_kmeans backends on synthetic cohorts')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--room-capacity', type=int, default=2)
+    parser.add_argument('--backends', nargs='+', default=KMEANS_BACKENDS, choices=KMEANS_BACKENDS)
+    parser.add_argument('--kmeans-limit', type=int, default=5000,
+                        help='largest cohort to run full-batch KMeans on')
+    args = parser.parse_args()
+    print(run(args.sizes, args.room_capacity, args.backends, args.kmeans_limit).to_string(index=False))
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+
+# Columns scored by RoomAllocator.calculate_compatibility_score, in code-matrix order
+FEATURE_COLUMNS = ['gender', 'course', 'year', 'sleep_time', 'study_hours', 'social_level', 'cleanliness']
+
+# Points awarded per matching field; gender is a gate worth 10, the rest are additive
+GENDER_WEIGHT = 10
+FEATURE_WEIGHTS = np.array([GENDER_WEIGHT, 5, 3, 2, 2, 2, 2], dtype=np.uint8)
+MAX_SCORE = int(FEATURE_WEIGHTS.sum())
+
+
+class StudentEncoder:
+    """Encode student feature columns once as integer codes.
+
+    Each column keeps its own vocabulary so that students encoded later
+    (late arrivals) share codes with the cohort already encoded. Missing
+    values get a fresh negative code, so they never equal anything else,
+    just like NaN never compares equal in the per-pair score.
+    """
+
+    def __init__(self):
+        self.vocabularies = {col: {} for col in FEATURE_COLUMNS}
+        self._next_missing = -1
+
+    def transform(self, df):
+        """Return an (n, 7) int32 code matrix for the rows of df"""
+        n = len(df)
+        codes = np.empty((n, len(FEATURE_COLUMNS)), dtype=np.int32)
+        for j, col in enumerate(FEATURE_COLUMNS):
+            if col not in df.columns:
+                # Absent fields compare equal (None == None) in the per-pair score
+                codes[:, j] = 0
+                continue
+            local_codes, uniques = pd.factorize(df[col], use_na_sentinel=True)
+            vocab = self.vocabularies[col]
+            lookup = np.empty(len(uniques), dtype=np.int32)
+            for k, value in enumerate(uniques):
+                lookup[k] = vocab.setdefault(value, len(vocab))
+            column = np.empty(n, dtype=np.int32)
+            present = local_codes >= 0
+            column[present] = lookup[local_codes[present]]
+            n_missing = n - int(present.sum())
+            if n_missing:
+                column[~present] = np.arange(self._next_missing, self._next_missing - n_missing, -1)
+                self._next_missing -= n_missing
+            codes[:, j] = column
+        return codes
+
+
+def score_block(codes, rows, cols):
+    """Compatibility scores between students `rows` and `cols` as a uint8 block.
+
+    Matches RoomAllocator.calculate_compatibility_score exactly: 0 across
+    genders, otherwise 10 plus 5/3/2 per matching course/year/lifestyle field.
+    """
+    a = codes[rows]
+    b = codes[cols]
+    scores = np.full((len(a), len(b)), GENDER_WEIGHT, dtype=np.uint8)
+    for j in range(1, len(FEATURE_COLUMNS)):
+        scores += FEATURE_WEIGHTS[j] * (a[:, j, None] == b[None, :, j])
+    scores *= a[:, 0, None] == b[None, :, 0]
+    return scores
+
+
+def score_row(codes, row, cols):
+    """Compatibility scores between one student and the students `cols`"""
+    return score_block(codes, [row], cols)[0]
+
+
+def pair_scores(codes, left, right):
+    """Element-wise compatibility scores of the pairs (left[k], right[k])"""
+    a = codes[left]
+    b = codes[right]
+    scores = np.full(len(a), GENDER_WEIGHT, dtype=np.uint8)
+    for j in range(1, len(FEATURE_COLUMNS)):
+        scores += FEATURE_WEIGHTS[j] * (a[:, j] == b[:, j])
+    scores *= a[:, 0] == b[:, 0]
+    return scores
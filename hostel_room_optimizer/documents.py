@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import PyPDF2
+
+from ingest import ParsedFileCache, content_hash
+
+# Threads extracting PDF page text in the background
+PDF_WORKERS = 2
+
+# Pages queued for extraction ahead of the one being viewed
+PDF_PREFETCH_PAGES = 2
+
+# Extracted page text, keyed by (file hash, page number), shared by every open document
+page_text_cache = ParsedFileCache(max_entries=4096, max_bytes=64 * 1024 * 1024)
+
+_executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix='pdf-text')
+
+
+class PdfDocument:
+    """A PDF opened once, with page text extracted lazily on worker threads.
+
+    Opening only reads the page count and metadata. Text for a page is
+    extracted the first time it is requested (or prefetched) and cached by
+    file hash and page number, so reruns and re-uploads of the same file
+    never re-extract it. `nbytes` is the file size, which the reader keeps
+    in memory for as long as the document is open.
+    """
+
+    def __init__(self, data):
+        self.key = content_hash(data)
+        self.nbytes = len(data)
+        self._reader = PyPDF2.PdfReader(BytesIO(data))
+        # The reader shares one stream, so pages are parsed one at a time
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.pages = len(self._reader.pages)
+        self.metadata = self._read_metadata()
+
+    def _read_metadata(self):
+        try:
+            info = self._reader.metadata or {}
+        except Exception:
+            return {}
+        return {str(k).lstrip('/'): str(v) for k, v in info.items()}
+
+    def _extract(self, page):
+        with self._lock:
+            try:
+                text = self._reader.pages[page].extract_text() or ""
+            except Exception:
+                text = ""
+        page_text_cache.put((self.key, page), text)
+        return text
+
+    def _submit(self, page):
+        future = self._pending.get(page)
+        if future is None or (future.done() and (self.key, page) not in page_text_cache):
+            future = self._pending[page] = _executor.submit(self._extract, page)
+        return future
+
+    def is_extracted(self, page):
+        return (self.key, page) in page_text_cache
+
+    def prefetch(self, pages):
+        """Queue pages for background extraction without waiting"""
+        for page in pages:
+            if 0 <= page < self.pages and not self.is_extracted(page):
+                self._submit(page)
+
+    def page_text(self, page, timeout=None):
+        """Text of a zero-based page, waiting for its extraction if needed"""
+        if not 0 <= page < self.pages:
+            raise ValueError(f"Page {page + 1} is out of range (1-{self.pages})")
+        text = page_text_cache.get((self.key, page))
+        if text is None:
+            text = self._submit(page).result(timeout)
+        self._pending.pop(page, None)
+        self.prefetch(range(page + 1, page + 1 + PDF_PREFETCH_PAGES))
+        return text
@@ -1,39 +1,171 @@
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 import pandas as pd
 import numpy as np
-import random
+import pyarrow as pa
+import pyarrow.parquet as pq
 
-def generate_student(n=50, seed=42):
-    random.seed(seed)
-    np.random.seed(seed)
-    rows = []
-    regions = ['North', 'South', 'East', 'West', 'Central']
-    for i in range(n):
-        name = f"Student_{i+1:03d}"
-        # sleep_time: typical sleep hour (0-23)
-        sleep_time = int(np.clip(np.random.normal(1 if np.random.rand()<0.5 else 23, 2) % 24, 0, 23))
+REGIONS = np.array(['North', 'South', 'East', 'West', 'Central'])
+
+# Students drawn from each seed block; a cohort is the concatenation of its blocks,
+# so the same seed gives the same students however the output is chunked
+BLOCK_ROWS = 100_000
+
+# Seed blocks written to each shard file by generate_shards
+SHARD_BLOCKS = 10
+MANIFEST_NAME = 'manifest.json'
+
+
+def _block_rng(seed, block):
+    # Equivalent to the block-th child of SeedSequence(seed).spawn(...)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(block,)))
+
+
+def _normal_score(rng, mean, count):
+    return np.clip(rng.normal(mean, 2, count), 0, 10).astype(np.int64)
+
+
+def generate_block(block, count=BLOCK_ROWS, seed=42):
+    """Generate the students of one seed block, whole columns at a time"""
+    rng = _block_rng(seed, block)
+    start = block * BLOCK_ROWS
+    # sleep_time: typical sleep hour (0-23), around 1am or 11pm
+    centers = np.where(rng.random(count) < 0.5, 1, 23)
+    sleep_time = np.clip(rng.normal(centers, 2) % 24, 0, 23).astype(np.int64)
+    return pd.DataFrame({
+        'name': [f"Student_{i:03d}" for i in range(start + 1, start + count + 1)],
+        'sleep_time': sleep_time,
         # study_pref: 0 (low) - 10 (high)
-        study_pref = int(np.clip(np.random.normal(6, 2), 0, 10))
+        'study_pref': _normal_score(rng, 6, count),
         # cleanliness: 0-10
-        cleanliness = int(np.clip(np.random.normal(6, 2), 0, 10))
+        'cleanliness': _normal_score(rng, 6, count),
         # smoker: 0/1
-        smoker = int(np.random.rand() < 0.1)
+        'smoker': (rng.random(count) < 0.1).astype(np.int64),
         # noise_tolerance: 0-10 (higher means tolerates noise)
-        noise_tolerance = int(np.clip(np.random.normal(5, 2), 0, 10))
+        'noise_tolerance': _normal_score(rng, 5, count),
         # hometown region
-        region = np.random.choice(regions)
-        rows.append({
-            'name': name,
-            'sleep_time': sleep_time,
-            'study_pref': study_pref,
-            'cleanliness': cleanliness,
-            'smoker': smoker,
-            'noise_tolerance': noise_tolerance,
-            'region': region
-        })
-    return pd.DataFrame(rows)
+        'region': REGIONS[rng.integers(0, len(REGIONS), count)],
+    }, index=pd.RangeIndex(start, start + count))
+
+
+def iter_student_blocks(n, seed=42, first_block=0, last_block=None):
+    """Yield a cohort of n students block by block, from first_block up to last_block"""
+    blocks = -(-n // BLOCK_ROWS)
+    for block in range(first_block, blocks if last_block is None else min(last_block, blocks)):
+        yield generate_block(block, min(BLOCK_ROWS, n - block * BLOCK_ROWS), seed)
+
+
+def generate_student(n=50, seed=42):
+    """Generate a synthetic cohort of n students in memory"""
+    if n <= 0:
+        return generate_block(0, 0, seed)
+    return pd.concat(iter_student_blocks(n, seed))
+
+
+def write_students(path, n, seed=42, file_format=None):
+    """Write a cohort to CSV or Parquet one block at a time, without holding it in memory"""
+    file_format = file_format or ('parquet' if str(path).endswith('.parquet') else 'csv')
+    return _write_blocks(path, iter_student_blocks(n, seed), file_format)
+
+
+def _write_blocks(path, blocks, file_format):
+    if file_format == 'csv':
+        with open(path, 'w', newline='') as f:
+            for i, block in enumerate(blocks):
+                block.to_csv(f, index=False, header=i == 0)
+    elif file_format == 'parquet':
+        writer = None
+        try:
+            for block in blocks:
+                table = pa.Table.from_pandas(block, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"Unsupported output format: {file_format}")
+    return path
+
+
+def file_digest(path):
+    """blake2b digest of a file, read in 1 MB pieces"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for piece in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(piece)
+    return digest.hexdigest()
+
+
+def _write_shard(directory, shard, n, seed, file_format, shard_blocks):
+    # Process-pool worker: a shard is a fixed range of seed blocks, so its
+    # contents do not depend on which worker writes it
+    first_block = shard * shard_blocks
+    name = f"students-{shard:05d}.{file_format}"
+    path = os.path.join(directory, name)
+    _write_blocks(path, iter_student_blocks(n, seed, first_block, first_block + shard_blocks), file_format)
+    first_row = first_block * BLOCK_ROWS
+    return {
+        'path': name,
+        'first_row': first_row,
+        'rows': min(n, first_row + shard_blocks * BLOCK_ROWS) - first_row,
+        'digest': file_digest(path),
+    }
+
+
+def generate_shards(directory, n, seed=42, workers=None, file_format='parquet', shard_blocks=SHARD_BLOCKS):
+    """Write a cohort of n students as shard files plus a manifest, in parallel.
+
+    Every shard is generated from its own spawned seed blocks, so the files
+    are identical for a given seed whatever the number of workers. Returns
+    the manifest path.
+    """
+    if file_format not in ('csv', 'parquet'):
+        raise ValueError(f"Unsupported output format: {file_format}")
+    if n < 1:
+        raise ValueError("Cohort size must be at least 1")
+    os.makedirs(directory, exist_ok=True)
+    shards = max(1, -(-n // (shard_blocks * BLOCK_ROWS)))
+    args = [(directory, shard, n, seed, file_format, shard_blocks) for shard in range(shards)]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and shards > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, shards)) as pool:
+            entries = list(pool.map(_write_shard, *zip(*args)))
+    else:
+        entries = [_write_shard(*arg) for arg in args]
+    manifest = {
+        'seed': seed,
+        'rows': n,
+        'block_rows': BLOCK_ROWS,
+        'shard_blocks': shard_blocks,
+        'format': file_format,
+        'columns': list(generate_block(0, 0, seed).columns),
+        'shards': entries,
+    }
+    manifest_path = os.path.join(directory, MANIFEST_NAME)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
 
 if __name__ == '__main__':
-    df = generate_student(60)
-    df.to_csv('sample_data.csv', index=False)
-    print('Wrote sample_data.csv with', len(df), 'rows')
+    parser = argparse.ArgumentParser(description='Generate synthetic student data')
+    parser.add_argument('--rows', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='sample_data.csv',
+                        help='.csv or .parquet file, or a directory when --shards is given')
+    parser.add_argument('--shards', action='store_true', help='write shard files and a manifest')
+    parser.add_argument('--format', default='parquet', choices=['csv', 'parquet'], help='shard file format')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    if args.shards:
+        path = generate_shards(args.output, args.rows, args.seed, args.workers, args.format)
+        print('Wrote', path, 'with', args.rows, 'rows')
+    else:
+        write_students(args.output, args.rows, args.seed)
+        print('Wrote', args.output, 'with', args.rows, 'rows')
@@ -0,0 +1,596 @@
+import codecs
+import hashlib
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from io import BytesIO
+
+import openpyxl
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from pandas.api.types import (is_bool_dtype, is_integer_dtype, is_object_dtype, is_string_dtype,
+                              union_categoricals)
+
+from schema import projected_columns
+
+# Bounds for parsed uploads kept across Streamlit reruns
+CACHE_MAX_ENTRIES = 16
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Rows parsed per chunk when streaming large rosters
+CSV_CHUNK_ROWS = 250_000
+
+# Text columns whose distinct values are at most this share of the rows become categorical
+CATEGORY_MAX_RATIO = 0.5
+
+COLUMNAR_TYPES = ['parquet', 'feather', 'arrow']
+
+# Worksheet rows collected per batch when streaming Excel workbooks
+EXCEL_BATCH_ROWS = 50_000
+
+RECORD_TYPES = ['json', 'xml']
+
+# JSON/XML records collected per batch, and bytes read per step while scanning
+RECORD_BATCH_ROWS = 50_000
+READ_BLOCK_BYTES = 1024 * 1024
+
+# Bytes inspected to detect a text file's encoding, and characters kept for its preview
+TEXT_SAMPLE_BYTES = 64 * 1024
+TEXT_PREVIEW_CHARS = 200
+
+# Byte order marks, longest first so UTF-32 is not mistaken for UTF-16
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# UTF-8 continuation bytes; every other byte starts a character
+UTF8_CONTINUATION = bytes(range(0x80, 0xC0))
+
+# Download formats for tabular exports: extension and MIME type
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Feather': ('feather', 'application/vnd.apache.arrow.file'),
+}
+
+
+def content_hash(data):
+    """Stable digest of an uploaded file's bytes"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def estimate_size(value):
+    """Approximate memory held by a parsed file result"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        # Arrays and objects holding a buffer, such as an open PdfDocument
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class ParsedFileCache:
+    """LRU cache of parsed upload results keyed by content hash.
+
+    Evicts least recently used entries once either the entry count or the
+    estimated memory budget is exceeded. A result larger than the whole
+    budget is not cached at all.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(data, file_type):
+        return f"{file_type}:{content_hash(data)}"
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return a cached result, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, result):
+        """Cache a parsed result, evicting old entries to stay within budget"""
+        size = estimate_size(result)
+        if key in self._entries:
+            self.total_bytes -= self._entries.pop(key)[1]
+        if size > self.max_bytes:
+            return result
+        self._entries[key] = (result, size)
+        self.total_bytes += size
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+        return result
+
+    def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+
+class CompactFrameBuilder:
+    """Assemble a compact DataFrame from batches of rows.
+
+    The schema is inferred from the first batch: low-cardinality text columns
+    become `category` and integer columns are downcast to the smallest dtype.
+    Each batch is compacted as it arrives, so only compact batches are held
+    until `build` concatenates them.
+    """
+
+    def __init__(self, category_ratio=CATEGORY_MAX_RATIO):
+        self.category_ratio = category_ratio
+        self.schema = None
+        self.rows = 0
+        self._batches = []
+
+    def infer_schema(self, batch):
+        schema = {}
+        for col in batch.columns:
+            values = batch[col]
+            if is_bool_dtype(values):
+                continue
+            if is_integer_dtype(values):
+                schema[col] = 'integer'
+            elif is_object_dtype(values) or is_string_dtype(values):
+                if values.nunique(dropna=True) <= max(1, self.category_ratio * len(values)):
+                    schema[col] = 'category'
+        return schema
+
+    def add(self, batch):
+        """Compact a batch and keep it for the final frame"""
+        if self.schema is None:
+            self.schema = self.infer_schema(batch)
+        for col, kind in self.schema.items():
+            if col not in batch.columns:
+                continue
+            if kind == 'category':
+                batch[col] = batch[col].astype('category')
+            elif is_integer_dtype(batch[col]):
+                batch[col] = pd.to_numeric(batch[col], downcast='integer')
+        self._batches.append(batch)
+        self.rows += len(batch)
+        return batch
+
+    def build(self):
+        """Concatenate the batches, merging category vocabularies"""
+        if not self._batches:
+            return pd.DataFrame()
+        if len(self._batches) == 1:
+            return self._batches[0].reset_index(drop=True)
+        columns = {}
+        names = list(dict.fromkeys(col for batch in self._batches for col in batch.columns))
+        for col in names:
+            # Batches that lack a column (e.g. optional JSON keys) contribute missing values
+            kind = self.schema.get(col)
+            parts = [batch[col] if col in batch.columns
+                     else pd.Series([None] * len(batch), dtype='category' if kind == 'category' else object)
+                     for batch in self._batches]
+            if kind == 'category':
+                try:
+                    columns[col] = pd.Series(union_categoricals(parts, ignore_order=True), name=col)
+                    continue
+                except TypeError:
+                    # Category dtypes differ between batches (e.g. an all-empty batch)
+                    parts = [part.astype(object) for part in parts]
+                    columns[col] = pd.concat(parts, ignore_index=True).astype('category')
+                    continue
+            columns[col] = pd.concat(parts, ignore_index=True)
+        self._batches = []
+        return pd.DataFrame(columns)
+
+
+def read_csv_chunked(file, chunksize=CSV_CHUNK_ROWS, **read_kwargs):
+    """Stream a CSV through the C parser in chunks into a compact DataFrame"""
+    builder = CompactFrameBuilder()
+    for chunk in pd.read_csv(file, chunksize=chunksize, engine='c', **read_kwargs):
+        builder.add(chunk)
+    return builder.build()
+
+
+def read_columnar(file, file_type):
+    """Read a Parquet, Feather or Arrow IPC file, loading only allocator columns.
+
+    Returns (frame, total column count). When the file does not look like a
+    student roster every column is loaded.
+    """
+    try:
+        file.seek(0)
+    except Exception:
+        pass
+    data = file.read() if hasattr(file, 'read') else file
+    if file_type == 'parquet':
+        parquet_file = pq.ParquetFile(pa.BufferReader(data))
+        names = parquet_file.schema_arrow.names
+        table = parquet_file.read(columns=projected_columns(names))
+    else:
+        try:
+            names = pa.ipc.open_file(pa.BufferReader(data)).schema.names
+            table = feather.read_table(pa.BufferReader(data), columns=projected_columns(names))
+        except pa.ArrowInvalid:
+            # Arrow IPC stream format rather than the random-access file format
+            table = pa.ipc.open_stream(pa.BufferReader(data)).read_all()
+            names = table.schema.names
+            columns = projected_columns(names)
+            if columns is not None:
+                table = table.select(columns)
+    return table.to_pandas(), len(names)
+
+
+def export_frame(df, export_format):
+    """Serialize a results table for download in one of EXPORT_FORMATS"""
+    if export_format == 'CSV':
+        return df.to_csv(index=False).encode('utf-8')
+    # Mixed-type object columns (e.g. 'N/A' next to numbers) are written as text
+    df = df.astype({col: 'string' for col in df.columns if is_object_dtype(df[col])})
+    buffer = BytesIO()
+    if export_format == 'Parquet':
+        df.to_parquet(buffer, index=False)
+    elif export_format == 'Feather':
+        feather.write_feather(df, buffer)
+    else:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    return buffer.getvalue()
+
+
+def excel_header(values):
+    """Column names for a header row, filling blanks and de-duplicating like pandas"""
+    names = []
+    seen = {}
+    for i, value in enumerate(values):
+        name = f"Unnamed: {i}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def excel_sheet_names(file):
+    """List a workbook's sheets without parsing any of them"""
+    try:
+        file.seek(0)
+    except Exception:
+        pass
+    workbook = openpyxl.load_workbook(file, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def iter_excel_batches(file, sheet_name=None, batch_rows=EXCEL_BATCH_ROWS):
+    """Yield a worksheet as DataFrame batches using openpyxl's read-only row iterator.
+
+    Only the selected sheet (the first one by default) is parsed. Fully blank
+    rows are skipped.
+    """
+    try:
+        file.seek(0)
+    except Exception:
+        pass
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.worksheets[0]
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = excel_header(header)
+        width = len(columns)
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            batch.append(row)
+            if len(batch) >= batch_rows:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def read_excel_streaming(file, sheet_name=None, batch_rows=EXCEL_BATCH_ROWS):
+    """Stream one worksheet into a compact DataFrame"""
+    builder = CompactFrameBuilder()
+    for batch in iter_excel_batches(file, sheet_name, batch_rows):
+        builder.add(batch)
+    return builder.build()
+
+
+def _rewind(file):
+    try:
+        file.seek(0)
+    except Exception:
+        pass
+    return file if hasattr(file, 'read') else BytesIO(file)
+
+
+def _iter_text_blocks(file):
+    """Decode a binary or text stream incrementally in READ_BLOCK_BYTES blocks"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    while True:
+        block = file.read(READ_BLOCK_BYTES)
+        if not block:
+            break
+        yield decoder.decode(block) if isinstance(block, bytes) else block
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _wrapped_records(obj):
+    # The record list of a wrapper object such as {"students": [...]}, or None when
+    # obj is itself a record: a wrapper has no scalar fields and one list of objects
+    if any(not isinstance(v, (list, dict)) for v in obj.values()):
+        return None
+    lists = [v for v in obj.values() if isinstance(v, list) and all(isinstance(r, dict) for r in v)]
+    return lists[0] if len(lists) == 1 else None
+
+
+def iter_json_records(file):
+    """Yield the objects of a JSON array or of a JSON-lines stream one at a time.
+
+    A top-level object holding a list of records (e.g. {"students": [...]})
+    is also accepted, but has to be loaded whole; any other single object is
+    one record.
+    """
+    decoder = json.JSONDecoder()
+    blocks = _iter_text_blocks(file)
+    buffer = ''
+    pos = 0
+
+    def fill(minimum=1):
+        # Append at least `minimum` more characters, dropping the consumed prefix;
+        # False at end of input
+        nonlocal buffer, pos
+        parts = [buffer[pos:]]
+        added = 0
+        for block in blocks:
+            parts.append(block)
+            added += len(block)
+            if added >= minimum:
+                break
+        buffer = ''.join(parts)
+        pos = 0
+        return added > 0
+
+    def skip(chars):
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return pos < len(buffer)
+
+    def decode_value():
+        # Decode one value, reading more input until it is complete
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Double the pending text before retrying so large values parse in linear time
+                if not fill(len(buffer) - pos):
+                    raise
+                continue
+            if end == len(buffer) and fill():
+                # A number may continue in the next block
+                continue
+            pos = end
+            return value
+
+    if not skip(' \t\r\n'):
+        return
+    if buffer[pos] == '[':
+        pos += 1
+        while skip(' \t\r\n,'):
+            if buffer[pos] == ']':
+                return
+            yield decode_value()
+        return
+    first = decode_value()
+    if not skip(' \t\r\n'):
+        # A single document: look for its list of records
+        if isinstance(first, list):
+            yield from first
+        elif isinstance(first, dict):
+            records = _wrapped_records(first)
+            yield from (records if records is not None else [first])
+        return
+    yield first
+    while skip(' \t\r\n'):
+        yield decode_value()
+
+
+def iter_xml_records(file, record_tag=None):
+    """Yield XML records as dicts with iterparse, clearing each element once read.
+
+    Records are the children of the root element (or every `record_tag`
+    element); their attributes and the text of their child elements become
+    the fields.
+    """
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(_rewind(file), events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if (elem.tag == record_tag) if record_tag is not None else (depth == 1):
+            record = dict(elem.attrib)
+            for child in elem:
+                record[child.tag] = child.text.strip() if child.text is not None else None
+            if not len(elem) and elem.text is not None and elem.text.strip():
+                record[elem.tag] = elem.text.strip()
+            yield record
+            elem.clear()
+            if root is not None and record_tag is None:
+                # Drop finished records from the root so memory stays bounded
+                root.clear()
+
+
+def _records_frame(records, numeric_text=False):
+    batch = pd.DataFrame.from_records(records)
+    for col in batch.columns:
+        if is_object_dtype(batch[col]):
+            nested = batch[col].map(lambda v: isinstance(v, (list, dict)))
+            if nested.any():
+                # Nested values (e.g. a list of guardians) are kept as JSON text
+                batch.loc[nested, col] = batch.loc[nested, col].map(json.dumps)
+    if numeric_text:
+        # XML carries everything as text; restore numeric columns like the CSV reader would
+        for col in batch.columns:
+            try:
+                batch[col] = pd.to_numeric(batch[col])
+            except (ValueError, TypeError):
+                pass
+    return batch
+
+
+def iter_record_batches(file, file_type, batch_rows=RECORD_BATCH_ROWS):
+    """Yield JSON/JSON-lines or XML records as DataFrame batches"""
+    if file_type == 'json':
+        records = iter_json_records(_rewind(file))
+    elif file_type == 'xml':
+        records = iter_xml_records(file)
+    else:
+        raise ValueError(f"Unsupported record format: {file_type}")
+    batch = []
+    for record in records:
+        if not isinstance(record, dict):
+            raise ValueError("Expected each JSON record to be an object")
+        batch.append(record)
+        if len(batch) >= batch_rows:
+            yield _records_frame(batch, file_type == 'xml')
+            batch = []
+    if batch:
+        yield _records_frame(batch, file_type == 'xml')
+
+
+def read_records(file, file_type, batch_rows=RECORD_BATCH_ROWS):
+    """Stream a JSON or XML roster into a compact DataFrame"""
+    builder = CompactFrameBuilder()
+    for batch in iter_record_batches(file, file_type, batch_rows):
+        builder.add(batch)
+    return builder.build()
+
+
+def detect_encoding(sample):
+    """Guess a text encoding from its first bytes: BOM, then UTF-8, else Latin-1"""
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        # A multi-byte character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def scan_text(file, sample_bytes=TEXT_SAMPLE_BYTES, preview_chars=TEXT_PREVIEW_CHARS):
+    """Count a text file's lines and characters in fixed-size blocks.
+
+    Only the sample used for encoding detection and the preview is decoded.
+    UTF-8 and Latin-1 files are counted on the raw bytes; other encodings
+    are decoded block by block. Lines are counted as newlines plus one.
+    """
+    file = _rewind(file)
+
+    def read(size):
+        block = file.read(size)
+        return block.encode('utf-8') if isinstance(block, str) else block
+
+    sample = read(sample_bytes)
+    encoding = detect_encoding(sample)
+    preview = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(sample)
+
+    newlines = 0
+    characters = 0
+    decoder = None if encoding in ('utf-8', 'latin-1') else codecs.getincrementaldecoder(encoding)(errors='ignore')
+    block = sample
+    while block:
+        if decoder is not None:
+            text = decoder.decode(block)
+            newlines += text.count('\n')
+            characters += len(text)
+        else:
+            newlines += block.count(b'\n')
+            # In UTF-8 every byte except a continuation byte starts a character
+            characters += len(block) if encoding == 'latin-1' else len(block.translate(None, UTF8_CONTINUATION))
+        block = read(READ_BLOCK_BYTES)
+    return {
+        'lines': newlines + 1,
+        'characters': characters,
+        'encoding': encoding,
+        'preview': preview[:preview_chars] + "..." if characters > preview_chars else preview,
+    }
+
+
+def read_manifest(path):
+    """Load a shard manifest written by generate_data.generate_shards.
+
+    Shard paths are resolved against the manifest's directory; no shard is
+    opened until it is iterated.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for shard in manifest['shards']:
+        shard['path'] = os.path.join(base, shard['path'])
+    return manifest
+
+
+def iter_manifest_batches(manifest, columns=None, batch_rows=RECORD_BATCH_ROWS):
+    """Yield the rows of a sharded dataset as DataFrame batches, one shard at a time"""
+    if isinstance(manifest, (str, os.PathLike)):
+        manifest = read_manifest(manifest)
+    for shard in manifest['shards']:
+        if manifest['format'] == 'parquet':
+            for batch in pq.ParquetFile(shard['path']).iter_batches(batch_size=batch_rows, columns=columns):
+                yield batch.to_pandas()
+        else:
+            yield from pd.read_csv(shard['path'], chunksize=batch_rows, usecols=columns, engine='c')
+
+
+def read_manifest_frame(manifest, columns=None, batch_rows=RECORD_BATCH_ROWS):
+    """Read a sharded dataset into a compact DataFrame"""
+    builder = CompactFrameBuilder()
+    for batch in iter_manifest_batches(manifest, columns, batch_rows):
+        builder.add(batch)
+    return builder.build()
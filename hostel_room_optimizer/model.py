@@ -1,37 +1,326 @@
 
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.cluster import KMeans
+from sklearn.preprocessing import FunctionTransformer, StandardScaler, OneHotEncoder
+from sklearn.decomposition import TruncatedSVD
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import math
 
-def preprocess(df):
-    # columns expected: sleep_time, study_pref, cleanliness, smoker, noise_tolerance, region
-    numeric_features = ['sleep_time','study_pref','cleanliness','smoker','noise_tolerance']
-    categorical_features = ['region']
-    preprocessor = ColumnTransformer(transformers=[
-        ('num', StandardScaler(), numeric_features),
-        ('cat', OneHotEncoder(), categorical_features)
-    ])
-    X = preprocessor.fit_transform(df[numeric_features + categorical_features])
+# Centroids per level of the balanced hierarchy, and refinement rounds per level
+BALANCED_BRANCHING = 16
+BALANCED_ITERATIONS = 8
+
+# Clustering backends for fit_kmeans
+KMEANS_BACKENDS = ['kmeans', 'minibatch', 'hierarchical']
+MINIBATCH_SIZE = 4096
+
+# columns expected: sleep_time, study_pref, cleanliness, smoker, noise_tolerance, region
+NUMERIC_FEATURES = ['sleep_time','study_pref','cleanliness','smoker','noise_tolerance']
+CATEGORICAL_FEATURES = ['region']
+
+def to_float32(X):
+    return X.astype(np.float32)
+
+def compact_preprocessor(embedding_dim=None):
+    """float32 features: scaled numerics plus one-hot regions, or a dense embedding of the regions.
+
+    Without embedding_dim the output is a single float32 CSR matrix; the
+    scaled numerics are stored sparse in it alongside the one-hot columns,
+    as one matrix is what the clustering estimators take. With embedding_dim
+    the one-hot block is folded into embedding_dim TruncatedSVD components
+    and the output is a dense float32 array of len(NUMERIC_FEATURES) +
+    embedding_dim columns.
+    """
+    numeric = Pipeline([('scale', StandardScaler()), ('float32', FunctionTransformer(to_float32))])
+    if embedding_dim is None:
+        categorical = OneHotEncoder(dtype=np.float32)
+        sparse_threshold = 1.0
+    else:
+        categorical = Pipeline([
+            ('onehot', OneHotEncoder(dtype=np.float32)),
+            ('embed', TruncatedSVD(n_components=embedding_dim, random_state=42)),
+            ('float32', FunctionTransformer(to_float32)),
+        ])
+        sparse_threshold = 0.0
+    return ColumnTransformer(transformers=[
+        ('num', numeric, NUMERIC_FEATURES),
+        ('cat', categorical, CATEGORICAL_FEATURES)
+    ], sparse_threshold=sparse_threshold)
+
+def preprocess(df, preprocessor=None, compact=False, embedding_dim=None):
+    # Reuse an already fitted preprocessor (e.g. from the model registry) when given
+    if preprocessor is not None:
+        return preprocessor.transform(df[NUMERIC_FEATURES + CATEGORICAL_FEATURES]), preprocessor
+    if compact or embedding_dim is not None:
+        preprocessor = compact_preprocessor(embedding_dim)
+    else:
+        preprocessor = ColumnTransformer(transformers=[
+            ('num', StandardScaler(), NUMERIC_FEATURES),
+            ('cat', OneHotEncoder(), CATEGORICAL_FEATURES)
+        ])
+    X = preprocessor.fit_transform(df[NUMERIC_FEATURES + CATEGORICAL_FEATURES])
     return X, preprocessor
 
-def fit_kmeans(df, n_clusters):
-    X, pre = preprocess(df)
-    km = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+def _allot_clusters(sizes, n_clusters):
+    # Split n_clusters among groups in proportion to their sizes (largest
+    # remainder), giving each group at least one and at most `size` clusters
+    share = sizes * n_clusters / sizes.sum()
+    counts = np.clip(np.floor(share).astype(np.int64), 1, sizes)
+    while counts.sum() != n_clusters:
+        if counts.sum() < n_clusters:
+            room = np.where(counts < sizes, share - counts, -np.inf)
+            counts[np.argmax(room)] += 1
+        else:
+            room = np.where(counts > 1, counts - share, -np.inf)
+            counts[np.argmax(room)] -= 1
+    return counts
+
+
+class HierarchicalKMeans:
+    """Two-level k-means: a coarse MiniBatchKMeans, then KMeans inside each coarse cluster.
+
+    Fine clusters are shared out among coarse clusters in proportion to their
+    size, so each fine fit only sees its coarse cluster's points. With about
+    sqrt(n_clusters) coarse clusters an iteration costs O(n * sqrt(k))
+    instead of O(n * k).
+    """
+
+    def __init__(self, n_clusters, n_coarse=None, random_state=42):
+        self.n_clusters = n_clusters
+        self.n_coarse = n_coarse
+        self.random_state = random_state
+
+    def fit(self, X):
+        n_coarse = min(self.n_coarse or max(1, round(math.sqrt(self.n_clusters))), self.n_clusters)
+        self.coarse_ = MiniBatchKMeans(n_clusters=n_coarse, random_state=self.random_state, n_init=3,
+                                       batch_size=MINIBATCH_SIZE).fit(X)
+        coarse_labels = self.coarse_.labels_
+        sizes = np.bincount(coarse_labels, minlength=n_coarse)
+        present = np.flatnonzero(sizes)
+        counts = np.zeros(n_coarse, dtype=np.int64)
+        counts[present] = _allot_clusters(sizes[present], self.n_clusters)
+        self.offsets_ = np.concatenate([[0], np.cumsum(counts)])
+        self.fine_ = [None] * n_coarse
+        self.labels_ = np.empty(X.shape[0], dtype=np.int32)
+        centers = []
+        self.inertia_ = 0.0
+        for c in present:
+            members = np.flatnonzero(coarse_labels == c)
+            fine = KMeans(n_clusters=int(counts[c]), random_state=self.random_state, n_init=1).fit(X[members])
+            self.fine_[c] = fine
+            self.labels_[members] = self.offsets_[c] + fine.labels_
+            centers.append(fine.cluster_centers_)
+            self.inertia_ += fine.inertia_
+        self.cluster_centers_ = np.vstack(centers)
+        return self
+
+    def predict(self, X):
+        coarse_labels = self.coarse_.predict(X)
+        labels = np.empty(X.shape[0], dtype=np.int32)
+        for c in np.unique(coarse_labels):
+            members = np.flatnonzero(coarse_labels == c)
+            fine = self.fine_[c]
+            if fine is None:
+                # A coarse cluster left empty during fit: fall back to every fine center
+                labels[members] = _nearest_center(X[members], self.cluster_centers_)
+            else:
+                labels[members] = self.offsets_[c] + fine.predict(X[members])
+        return labels
+
+    def fit_predict(self, X):
+        return self.fit(X).labels_
+
+
+def _nearest_center(X, centers):
+    X = X.toarray() if hasattr(X, 'toarray') else np.asarray(X)
+    return np.argmin((centers ** 2).sum(axis=1)[None, :] - 2 * X @ centers.T, axis=1)
+
+
+def make_kmeans(n_clusters, backend='kmeans', random_state=42):
+    """Clustering estimator for a backend in KMEANS_BACKENDS"""
+    if backend == 'kmeans':
+        return KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+    if backend == 'minibatch':
+        return MiniBatchKMeans(n_clusters=n_clusters, random_state=random_state, n_init=3,
+                               batch_size=MINIBATCH_SIZE)
+    if backend == 'hierarchical':
+        return HierarchicalKMeans(n_clusters, random_state=random_state)
+    raise ValueError(f"Unknown clustering backend: {backend}")
+
+
+def fit_kmeans(df, n_clusters, backend='kmeans', compact=False, embedding_dim=None):
+    X, pre = preprocess(df, compact=compact, embedding_dim=embedding_dim)
+    km = make_kmeans(n_clusters, backend)
     labels = km.fit_predict(X)
     df2 = df.copy()
     df2['cluster'] = labels
     return df2, km, pre
 
-def allocate_rooms(df, room_capacity=2):
+
+def fit_kmeans_streaming(chunks, n_clusters, preprocessor=None):
+    """Fit MiniBatchKMeans on an iterable of DataFrame chunks with partial_fit.
+
+    The preprocessor is fitted on the first chunk unless one is given, so
+    that chunk should be representative (and hold at least n_clusters rows).
+    Returns (model, preprocessor).
+    """
+    km = MiniBatchKMeans(n_clusters=n_clusters, random_state=42, n_init=3, batch_size=MINIBATCH_SIZE)
+    for chunk in chunks:
+        X, preprocessor = preprocess(chunk, preprocessor)
+        km.partial_fit(X)
+    return km, preprocessor
+
+def balanced_assign(X, centers, capacities):
+    """Assign points to centers without exceeding each center's capacity.
+
+    Points whose best center beats their second best by the widest margin
+    (highest regret) choose first; a point turned away by a full center moves
+    on to its next nearest one. Vectorized over points, at most one round per
+    center.
+    """
+    n, k = len(X), len(centers)
+    # Squared distances up to the per-point constant |x|^2, which does not change any ranking
+    distances = (centers ** 2).sum(axis=1)[None, :] - 2 * X @ centers.T
+    choices = np.argsort(distances, axis=1)
+    if k > 1:
+        nearest = np.take_along_axis(distances, choices[:, :2], axis=1)
+        regret = nearest[:, 1] - nearest[:, 0]
+    else:
+        regret = np.zeros(n)
+    priority = np.empty(n, dtype=np.int64)
+    priority[np.argsort(-regret, kind='stable')] = np.arange(n)
+    labels = np.full(n, -1, dtype=np.int64)
+    remaining = np.asarray(capacities, dtype=np.int64).copy()
+    attempt = np.zeros(n, dtype=np.int64)
+    pending = np.arange(n)
+    for _ in range(k):
+        if not len(pending):
+            break
+        wanted = choices[pending, attempt[pending]]
+        order = np.lexsort((priority[pending], wanted))
+        pending, wanted = pending[order], wanted[order]
+        # Rank of each point among those asking for the same center
+        rank = np.arange(len(pending)) - np.searchsorted(wanted, wanted)
+        accepted = rank < remaining[wanted]
+        labels[pending[accepted]] = wanted[accepted]
+        remaining -= np.bincount(wanted[accepted], minlength=k)
+        pending = pending[~accepted]
+        attempt[pending] += 1
+    return labels
+
+
+def _plusplus_centers(X, k, rng):
+    # k-means++ seeding; sklearn's version costs more in input checks than in
+    # arithmetic for the small groups deep in the hierarchy
+    centers = np.empty((k, X.shape[1]), dtype=X.dtype)
+    centers[0] = X[rng.integers(len(X))]
+    closest = ((X - centers[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        pick = rng.choice(len(X), p=closest / total) if total > 0 else rng.integers(len(X))
+        centers[i] = X[pick]
+        np.minimum(closest, ((X - centers[i]) ** 2).sum(axis=1), out=closest)
+    return centers
+
+
+def balanced_kmeans(X, capacities, n_iter=BALANCED_ITERATIONS, random_state=42):
+    """k-means where cluster i holds exactly capacities[i] points (capacities sum to len(X))"""
+    k = len(capacities)
+    if k == 1:
+        return np.zeros(len(X), dtype=np.int64)
+    rng = np.random.default_rng(random_state) if not isinstance(random_state, np.random.Generator) else random_state
+    centers = _plusplus_centers(X, k, rng)
+    labels = None
+    for _ in range(n_iter):
+        new_labels = balanced_assign(X, centers, capacities)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)[:, None]
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, X)
+        centers = np.where(counts > 0, sums / np.maximum(counts, 1), centers)
+    return labels
+
+
+def _balanced_rooms(X, members, room_sizes, branching, random_state):
+    # Split members into groups of whole rooms until a group has at most
+    # `branching` rooms, then give each room its own centroid
+    if len(room_sizes) <= branching:
+        labels = balanced_kmeans(X[members], room_sizes, random_state=random_state)
+        order = np.argsort(labels, kind='stable')
+        return np.split(members[order], np.cumsum(room_sizes)[:-1])
+    # Only as many groups as needed for the leaves to hold close to `branching` rooms
+    groups = np.array_split(np.arange(len(room_sizes)), min(branching, math.ceil(len(room_sizes) / branching)))
+    capacities = [int(room_sizes[g].sum()) for g in groups]
+    labels = balanced_kmeans(X[members], capacities, random_state=random_state)
+    rooms = []
+    for label, group in enumerate(groups):
+        rooms.extend(_balanced_rooms(X, members[labels == label], room_sizes[group], branching, random_state))
+    return rooms
+
+
+def allocate_balanced_rooms(df, room_capacity=2, branching=BALANCED_BRANCHING, random_state=42,
+                            compact=False, embedding_dim=None):
+    """Capacity-constrained clustering straight into rooms.
+
+    Students are split hierarchically with balanced k-means, each group
+    holding a whole number of rooms, so every room is full (only the last
+    one is short when the cohort does not divide evenly). The work per level
+    is linear in the cohort, with logarithmically many levels.
+    """
+    n_students = len(df)
+    n_rooms = math.ceil(n_students / room_capacity)
+    if n_rooms == 0:
+        return []
+    X, pre = preprocess(df, compact=compact, embedding_dim=embedding_dim)
+    X = np.asarray(X.toarray() if hasattr(X, 'toarray') else X,
+                   dtype=np.float32 if compact or embedding_dim is not None else np.float64)
+    rng = np.random.default_rng(random_state)
+    room_sizes = np.full(n_rooms, room_capacity, dtype=np.int64)
+    room_sizes[-1] -= n_rooms * room_capacity - n_students
+    top = np.array_split(np.arange(n_rooms), min(branching, n_rooms))
+    labels = balanced_kmeans(X, [int(room_sizes[g].sum()) for g in top], random_state=rng)
+    names = df['name'].to_numpy()
+    rooms = []
+    for cluster_label, group in enumerate(top):
+        members = np.flatnonzero(labels == cluster_label)
+        for room in _balanced_rooms(X, members, room_sizes[group], branching, rng):
+            rooms.append({
+                'room_id': len(rooms) + 1,
+                'members': list(names[room]),
+                'cluster': cluster_label
+            })
+    return rooms
+
+def allocate_rooms(df, room_capacity=2, method='balanced', backend='kmeans', registry=None,
+                   compact=False, embedding_dim=None):
+    """Group students into rooms of room_capacity.
+
+    'balanced' uses capacity-constrained clustering so rooms come out full;
+    'pack' clusters into ceil(n / room_capacity) clusters with the given
+    fit_kmeans backend and chops each cluster into rooms. With a
+    ModelRegistry the 'pack' fit is stored and reused for the same cohort.
+    `compact` and `embedding_dim` select float32 features (see compact_preprocessor).
+    """
+    if method == 'balanced':
+        return allocate_balanced_rooms(df, room_capacity, compact=compact, embedding_dim=embedding_dim)
+    if method != 'pack':
+        raise ValueError(f"Unknown allocation method: {method}")
     # Determine number of rooms: ceiling of students/room_capacity
     n_students = len(df)
     n_rooms = math.ceil(n_students / room_capacity)
     # We'll cluster into n_rooms clusters and then pack
-    clustered, km, pre = fit_kmeans(df, n_clusters=n_rooms)
+    if registry is not None:
+        pre, km, _ = registry.fit_or_load(df, n_rooms, backend=backend, compact=compact,
+                                          embedding_dim=embedding_dim)
+        clustered = df.copy()
+        clustered['cluster'] = km.labels_
+    else:
+        clustered, km, pre = fit_kmeans(df, n_clusters=n_rooms, backend=backend, compact=compact,
+                                        embedding_dim=embedding_dim)
     # Group by cluster and distribute into rooms, filling up to room_capacity
     rooms = []
     room_id = 1
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import joblib
+import pandas as pd
+
+from model import CATEGORICAL_FEATURES, NUMERIC_FEATURES, fit_kmeans
+
+REGISTRY_DIR = 'model_artifacts'
+ARTIFACT_FILE = 'artifact.joblib'
+META_FILE = 'meta.json'
+
+
+def data_fingerprint(df):
+    """Hash of the feature columns a model is trained on, independent of row labels"""
+    features = df[NUMERIC_FEATURES + CATEGORICAL_FEATURES]
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(list(features.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(features, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def artifact_version(data_hash, params):
+    """Version id for a model trained on `data_hash` with `params`"""
+    key = json.dumps({'data': data_hash, 'params': params}, sort_keys=True)
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+class ModelRegistry:
+    """Fitted preprocessors and clustering models saved on disk by version.
+
+    A version is derived from the training data's hash and the fit
+    parameters, so fitting the same cohort with the same settings reuses the
+    stored artifact. Artifacts are saved uncompressed and loaded with
+    memory-mapped arrays; loaded versions are kept for the life of the
+    registry.
+    """
+
+    def __init__(self, directory=REGISTRY_DIR):
+        self.directory = directory
+        self._loaded = {}
+
+    def _path(self, version, name):
+        return os.path.join(self.directory, version, name)
+
+    def __contains__(self, version):
+        return os.path.exists(self._path(version, ARTIFACT_FILE))
+
+    def versions(self):
+        """Metadata of every stored version, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        metas = []
+        for version in os.listdir(self.directory):
+            meta_path = self._path(version, META_FILE)
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    metas.append(json.load(f))
+        return sorted(metas, key=lambda meta: meta['created'])
+
+    def save(self, preprocessor, model, df, params):
+        """Store a fitted preprocessor and model trained on df; returns the version"""
+        data_hash = data_fingerprint(df)
+        version = artifact_version(data_hash, params)
+        os.makedirs(os.path.join(self.directory, version), exist_ok=True)
+        joblib.dump({'preprocessor': preprocessor, 'model': model}, self._path(version, ARTIFACT_FILE))
+        meta = {
+            'version': version,
+            'data_hash': data_hash,
+            'params': params,
+            'rows': len(df),
+            'created': datetime.now().isoformat(timespec='microseconds'),
+        }
+        with open(self._path(version, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2)
+        self._loaded[version] = (preprocessor, model)
+        return version
+
+    def load(self, version=None, mmap_mode='r'):
+        """Return (preprocessor, model) for a version, the latest one by default"""
+        if version is None:
+            metas = self.versions()
+            if not metas:
+                raise ValueError(f"No model artifacts in {self.directory}")
+            version = metas[-1]['version']
+        if version not in self._loaded:
+            if version not in self:
+                raise ValueError(f"Unknown model version: {version}")
+            artifact = joblib.load(self._path(version, ARTIFACT_FILE), mmap_mode=mmap_mode)
+            self._loaded[version] = (artifact['preprocessor'], artifact['model'])
+        return self._loaded[version]
+
+    def fit_or_load(self, df, n_clusters, backend='kmeans', compact=False, embedding_dim=None):
+        """Reuse the stored model for this cohort and parameters, fitting it only once.
+
+        Returns (preprocessor, model, version).
+        """
+        params = {'n_clusters': int(n_clusters), 'backend': backend}
+        if compact or embedding_dim is not None:
+            params.update(compact=True, embedding_dim=embedding_dim)
+        version = artifact_version(data_fingerprint(df), params)
+        if version in self._loaded or version in self:
+            return (*self.load(version), version)
+        _, model, preprocessor = fit_kmeans(df, n_clusters, backend=backend, compact=compact,
+                                            embedding_dim=embedding_dim)
+        self.save(preprocessor, model, df, params)
+        return preprocessor, model, version
+
+    def assign(self, df, version=None):
+        """Cluster labels for (late-arriving) students: one transform and one predict, no refit"""
+        preprocessor, model = self.load(version)
+        return model.predict(preprocessor.transform(df[NUMERIC_FEATURES + CATEGORICAL_FEATURES]))
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+# Accepted header variations for each inventory column
+COLUMN_ALIASES = {
+    'room_id': ['room_id', 'roomid', 'room_number', 'room_no', 'room'],
+    'building': ['building', 'block', 'hall'],
+    'floor': ['floor', 'level'],
+    'capacity': ['capacity', 'beds', 'max_students'],
+    'gender': ['gender', 'designation', 'sex'],
+}
+
+# Gender designations that accept any student
+UNRESTRICTED = {'', 'any', 'mixed', 'co-ed', 'coed', 'all', 'nan', 'none'}
+ANY_GENDER = -1
+
+
+def normalize_gender(value):
+    """Fold gender labels like 'Male'/'M'/'male' onto one key"""
+    text = '' if value is None or (isinstance(value, float) and np.isnan(value)) else str(value).strip().lower()
+    if text in UNRESTRICTED:
+        return None
+    if text in ('m', 'male', 'boy', 'boys', 'men'):
+        return 'm'
+    if text in ('f', 'female', 'girl', 'girls', 'women'):
+        return 'f'
+    return text
+
+
+class RoomInventory:
+    """Physical rooms with heterogeneous capacities and gender designations.
+
+    Rooms are held in compact arrays and handed out through free lists keyed
+    by (gender, capacity), so taking or returning a room is O(1) in the number
+    of rooms.
+    """
+
+    def __init__(self, room_ids, capacity, gender=None, building=None, floor=None):
+        n = len(room_ids)
+        self.room_ids = np.asarray(room_ids, dtype=object)
+        self.capacity = np.asarray(capacity, dtype=np.int16)
+        if (self.capacity < 1).any():
+            raise ValueError("Room capacity must be at least 1")
+        labels = [normalize_gender(g) for g in (gender if gender is not None else [None] * n)]
+        self.gender_labels = sorted({g for g in labels if g is not None})
+        lookup = {g: i for i, g in enumerate(self.gender_labels)}
+        self.gender = np.array([ANY_GENDER if g is None else lookup[g] for g in labels], dtype=np.int8)
+        self.building = pd.Categorical(building if building is not None else [None] * n)
+        self.floor = np.asarray(floor if floor is not None else np.zeros(n), dtype=np.float32)
+        self.reset()
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build an inventory from a DataFrame with flexible column names"""
+        lower = {col.lower().strip().replace(' ', '_'): col for col in df.columns}
+        found = {}
+        for name, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in lower:
+                    found[name] = df[lower[alias]]
+                    break
+        for required in ('room_id', 'capacity'):
+            if required not in found:
+                raise ValueError(f"Missing required room column: {required}")
+        capacity = pd.to_numeric(found['capacity'], errors='coerce')
+        if capacity.isna().any():
+            raise ValueError("Room capacity must be numeric for every room")
+        return cls(found['room_id'].to_numpy(), capacity.to_numpy(),
+                   found['gender'].to_numpy() if 'gender' in found else None,
+                   found['building'].to_numpy() if 'building' in found else None,
+                   pd.to_numeric(found['floor'], errors='coerce').to_numpy() if 'floor' in found else None)
+
+    @classmethod
+    def from_csv(cls, file):
+        """Load an inventory CSV (room_id, building, floor, capacity, gender)"""
+        try:
+            file.seek(0)
+        except Exception:
+            pass
+        return cls.from_frame(pd.read_csv(file))
+
+    def __len__(self):
+        return len(self.room_ids)
+
+    def reset(self):
+        """Mark every room as free again"""
+        self._free = {}
+        # Reverse so that popping hands rooms out in inventory order
+        for index in range(len(self.room_ids) - 1, -1, -1):
+            key = (int(self.gender[index]), int(self.capacity[index]))
+            self._free.setdefault(key, []).append(index)
+        self._capacities = sorted({int(c) for c in self.capacity}, reverse=True)
+
+    def take(self, gender):
+        """Claim a free room for a student of this gender, or None when full.
+
+        Rooms designated for the gender are used before unrestricted ones,
+        largest capacity first.
+        """
+        label = normalize_gender(gender)
+        code = self.gender_labels.index(label) if label in self.gender_labels else None
+        for key_gender in ((code, ANY_GENDER) if code is not None else (ANY_GENDER,)):
+            for capacity in self._capacities:
+                free = self._free.get((key_gender, capacity))
+                if free:
+                    return free.pop()
+        return None
+
+    def release(self, index):
+        """Return a room to its free list"""
+        self._free.setdefault((int(self.gender[index]), int(self.capacity[index])), []).append(index)
+
+    def free_beds(self):
+        """Total capacity of the rooms still free"""
+        return sum(int(self.capacity[free].sum()) for free in self._free.values() if free)
+
+    def describe(self, index):
+        """Room fields for an allocation result"""
+        floor = self.floor[index]
+        return {
+            'room_number': str(self.room_ids[index]),
+            'capacity': int(self.capacity[index]),
+            'building': self.building[index],
+            'floor': None if np.isnan(floor) else int(floor),
+        }
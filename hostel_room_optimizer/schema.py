@@ -0,0 +1,143 @@
+import re
+from functools import lru_cache
+
+REQUIRED_COLUMNS = ['student_id', 'name', 'gender']
+
+# Optional allocator columns and the value used when a roster lacks them
+OPTIONAL_DEFAULTS = {
+    'course': 'General',
+    'year': 1,
+    'sleep_time': 'medium',
+    'study_hours': 'medium',
+    'social_level': 'medium',
+    'cleanliness': 'medium',
+}
+
+# Housing location columns kept when present so allocation can partition on them
+LOCATION_COLUMNS = ['building', 'block']
+
+STUDENT_COLUMNS = REQUIRED_COLUMNS + list(OPTIONAL_DEFAULTS) + LOCATION_COLUMNS
+
+# Distinct header signatures whose resolved mapping is kept
+SCHEMA_CACHE_SIZE = 256
+
+
+def _pattern(*needles):
+    return re.compile('|'.join(re.escape(needle) for needle in needles))
+
+
+# Alias rules compiled once: a header matches when its lower-cased name contains a needle.
+# Each rule lists its patterns in priority order; the first header matching wins.
+REQUIRED_RULES = [
+    (col, [_pattern(col.replace('_', ''), col)] + ([_pattern('id', 'student', 'roll')] if col == 'student_id' else []))
+    for col in REQUIRED_COLUMNS
+]
+OPTIONAL_RULES = [(col, _pattern(col.lower())) for col in OPTIONAL_DEFAULTS]
+LOCATION_RULES = [(col, _pattern(col)) for col in LOCATION_COLUMNS]
+
+
+class ResolvedSchema:
+    """Column mapping for one header signature.
+
+    `mapping` gives the source header for every allocator column found and
+    `defaults` the fill value for optional columns that are not. `unmapped`
+    lists headers no allocator column uses, and `ambiguous` maps allocator
+    columns to every header that matched their rule when more than one did.
+    """
+
+    def __init__(self, mapping, defaults, unmapped, ambiguous):
+        self.mapping = mapping
+        self.defaults = defaults
+        self.unmapped = unmapped
+        self.ambiguous = ambiguous
+
+    def report(self):
+        return {'unmapped_columns': list(self.unmapped),
+                'ambiguous_columns': {col: list(found) for col, found in self.ambiguous.items()}}
+
+    def apply(self, df):
+        """Normalized student frame: one column selection and rename, then defaults.
+
+        The selection shares the source frame's data rather than copying it
+        column by column.
+        """
+        targets = [col for col in STUDENT_COLUMNS if col in self.mapping]
+        students_df = df[[self.mapping[col] for col in targets]].set_axis(targets, axis=1)
+        if self.defaults:
+            students_df = students_df.assign(**self.defaults)
+        return students_df[[col for col in STUDENT_COLUMNS if col in students_df.columns]]
+
+
+def _matches(pattern, lowered):
+    return [i for i, name in enumerate(lowered) if pattern.search(name)]
+
+
+@lru_cache(maxsize=SCHEMA_CACHE_SIZE)
+def _resolve(signature):
+    lowered = [str(col).lower() for col in signature]
+    mapping = {}
+    ambiguous = {}
+
+    def pick(col, found):
+        if found:
+            mapping[col] = signature[found[0]]
+            if len(found) > 1:
+                ambiguous[col] = tuple(signature[i] for i in found)
+
+    for col, patterns in REQUIRED_RULES:
+        # Map common variations, then alternatives (for student_id)
+        for pattern in patterns:
+            found = _matches(pattern, lowered)
+            if found:
+                pick(col, found)
+                break
+        if col not in mapping:
+            raise ValueError(f"Missing required column: {col}")
+
+    defaults = {}
+    for col, pattern in OPTIONAL_RULES:
+        if col in signature:
+            mapping[col] = col
+            continue
+        # Try to find similar columns
+        found = _matches(pattern, lowered)
+        if found:
+            pick(col, found)
+        else:
+            defaults[col] = OPTIONAL_DEFAULTS[col]
+
+    for col, pattern in LOCATION_RULES:
+        pick(col, _matches(pattern, lowered))
+
+    used = set(mapping.values())
+    unmapped = tuple(col for col in signature if col not in used)
+    return ResolvedSchema(mapping, defaults, unmapped, ambiguous)
+
+
+def resolve_schema(columns):
+    """Resolve a roster's headers, reusing the result for a header signature seen before.
+
+    Raises ValueError when a required column cannot be found.
+    """
+    return _resolve(tuple(columns))
+
+
+def resolve_student_columns(columns):
+    """Map allocator column names onto a roster's headers.
+
+    Returns (mapping, defaults): `mapping` gives the source header for every
+    column found, `defaults` the fill value for optional columns that are not.
+    Raises ValueError when a required column cannot be found.
+    """
+    schema = resolve_schema(columns)
+    return dict(schema.mapping), dict(schema.defaults)
+
+
+def projected_columns(columns):
+    """Headers a reader must load to feed the allocator, or None if it needs them all"""
+    try:
+        mapping, _ = resolve_student_columns(columns)
+    except ValueError:
+        return None
+    wanted = set(mapping.values())
+    return [col for col in columns if col in wanted]
@@ -0,0 +1,149 @@
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from model import CATEGORICAL_FEATURES, NUMERIC_FEATURES, make_kmeans, preprocess
+
+# Default grid: 0 clusters means one cluster per room
+DEFAULT_CLUSTERS = [0]
+DEFAULT_WEIGHTS = [{}, {'sleep_time': 2.0}, {'cleanliness': 2.0}, {'smoker': 3.0}]
+DEFAULT_CAPACITIES = [2, 3, 4]
+
+# Feature matrix shared with the worker processes: (shared memory block, array view)
+_shared = None
+
+
+def feature_weights(preprocessor, weights):
+    """Per-column multipliers for a {feature: weight} dict; one-hot columns take their feature's weight"""
+    columns = preprocessor.get_feature_names_out()
+    vector = np.ones(len(columns))
+    for i, column in enumerate(columns):
+        # Names look like 'num__sleep_time' or 'cat__region_North'
+        name = column.split('__', 1)[1]
+        feature = next((f for f in CATEGORICAL_FEATURES if name.startswith(f + '_')), name)
+        vector[i] = weights.get(feature, 1.0)
+    return vector
+
+
+def pack_rooms(labels, room_capacity):
+    """Chop each cluster, in label order, into rooms of room_capacity (as in model.allocate_rooms)"""
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    rooms = []
+    for members in np.split(order, bounds):
+        rooms.extend(np.split(members, np.arange(room_capacity, len(members), room_capacity)))
+    return rooms
+
+
+def room_distance(X, rooms, room_capacity):
+    """Mean squared distance between roommates, over every pair of students sharing a room"""
+    padded = np.full((len(rooms), room_capacity), -1, dtype=np.int64)
+    for i, room in enumerate(rooms):
+        padded[i, :len(room)] = room
+    total = 0.0
+    pairs = 0
+    for a in range(room_capacity):
+        for b in range(a + 1, room_capacity):
+            both = (padded[:, a] >= 0) & (padded[:, b] >= 0)
+            diff = X[padded[both, a]] - X[padded[both, b]]
+            total += float((diff ** 2).sum())
+            pairs += int(both.sum())
+    return total / pairs if pairs else 0.0
+
+
+def _attach(name, shape, dtype):
+    # Worker initializer: map the parent's feature matrix without copying it
+    global _shared
+    block = shared_memory.SharedMemory(name=name)
+    _shared = (block, np.ndarray(shape, dtype=dtype, buffer=block.buf))
+
+
+def evaluate(config, weight_vector, backend='minibatch'):
+    """Fit one configuration on the shared feature matrix and score its rooms"""
+    X = _shared[1]
+    started = time.perf_counter()
+    n_clusters = config['n_clusters'] or math.ceil(len(X) / config['room_capacity'])
+    km = make_kmeans(n_clusters, backend)
+    labels = km.fit_predict(X * weight_vector)
+    rooms = pack_rooms(labels, config['room_capacity'])
+    elapsed = time.perf_counter() - started
+    # Roommates are compared on the unweighted features so every weighting is judged alike
+    distance = room_distance(X, rooms, config['room_capacity'])
+    return {
+        **config,
+        'n_clusters': n_clusters,
+        'rooms': len(rooms),
+        'full_rooms': sum(len(room) == config['room_capacity'] for room in rooms),
+        'inertia': round(float(km.inertia_), 3),
+        'room_distance': round(distance, 4),
+        'room_compatibility': round(1 / (1 + distance), 4),
+        'seconds': round(elapsed, 3),
+    }
+
+
+def run_sweep(df, clusters=DEFAULT_CLUSTERS, weights=DEFAULT_WEIGHTS, capacities=DEFAULT_CAPACITIES,
+              backend='minibatch', workers=None):
+    """Evaluate every (cluster count, feature weights, room capacity) combination in a process pool.
+
+    The features are preprocessed once and placed in shared memory; each
+    worker maps it instead of receiving its own copy. Returns one row per
+    configuration, best room compatibility first.
+    """
+    X, preprocessor = preprocess(df)
+    X = np.ascontiguousarray(X.toarray() if hasattr(X, 'toarray') else X, dtype=np.float64)
+    block = shared_memory.SharedMemory(create=True, size=max(X.nbytes, 1))
+    try:
+        np.ndarray(X.shape, dtype=X.dtype, buffer=block.buf)[:] = X
+        configs = [{'n_clusters': k, 'weights': ', '.join(f"{f}={w:g}" for f, w in w_dict.items()) or 'uniform',
+                    'room_capacity': cap, '_weights': w_dict}
+                   for k, w_dict, cap in product(clusters, weights, capacities)]
+        tasks = [({k: v for k, v in c.items() if k != '_weights'}, feature_weights(preprocessor, c['_weights']))
+                 for c in configs]
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_attach,
+                                 initargs=(block.name, X.shape, X.dtype)) as pool:
+            futures = [pool.submit(evaluate, config, vector, backend) for config, vector in tasks]
+            rows = [future.result() for future in futures]
+    finally:
+        block.close()
+        block.unlink()
+    return pd.DataFrame(rows).sort_values('room_compatibility', ascending=False, ignore_index=True)
+
+
+def _parse_weights(text):
+    # 'sleep_time=2,smoker=3' -> {'sleep_time': 2.0, 'smoker': 3.0}; 'uniform' -> {}
+    if text == 'uniform':
+        return {}
+    weights = {}
+    for item in text.split(','):
+        feature, value = item.split('=')
+        if feature not in NUMERIC_FEATURES + CATEGORICAL_FEATURES:
+            raise ValueError(f"Unknown feature: {feature}")
+        weights[feature] = float(value)
+    return weights
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep cluster counts, feature weights and room capacities')
+    parser.add_argument('--data', default='sample_data.csv', help='student CSV (see generate_data.py)')
+    parser.add_argument('--clusters', type=int, nargs='+', default=DEFAULT_CLUSTERS,
+                        help='cluster counts; 0 means one per room')
+    parser.add_argument('--weights', nargs='+', default=None,
+                        help="weight sets such as 'sleep_time=2,smoker=3' or 'uniform'")
+    parser.add_argument('--capacities', type=int, nargs='+', default=DEFAULT_CAPACITIES)
+    parser.add_argument('--backend', default='minibatch')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', default=None, help='also write the table to this CSV')
+    args = parser.parse_args()
+    weights = [_parse_weights(w) for w in args.weights] if args.weights else DEFAULT_WEIGHTS
+    table = run_sweep(pd.read_csv(args.data), args.clusters, weights, args.capacities, args.backend, args.workers)
+    print(table.to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)